@@ -0,0 +1,155 @@
+# approximate.py
+import numpy as np
+from ranking import Match
+from packed import PackedContours, SYMBOLS, STEPS_PER_WORD
+
+# Patterns are packed into one 64-bit word per document
+MAX_PATTERN_LENGTH = 64
+
+# Same codes as the packed contours, so their 2-bit symbols index Peq directly
+ALPHABET = SYMBOLS
+CODES = {symbol: code for code, symbol in enumerate(ALPHABET)}
+# Lookup table from ASCII bytes to symbol codes; anything else never matches
+_LUT = np.full(256, len(ALPHABET), dtype=np.uint8)
+for _symbol, _code in CODES.items():
+    _LUT[ord(_symbol)] = _code
+
+_ONE = np.uint64(1)
+_THREE = np.uint64(3)
+
+
+def encode(contour):
+    """Converts a contour string into an array of symbol codes."""
+    return _LUT[np.frombuffer(contour.upper().encode("ascii", errors="replace"), dtype=np.uint8)]
+
+
+def window_alignment(pattern, text, end, max_errors):
+    """
+    Finds the start of the best window of text ending at `end` (inclusive)
+    for the pattern. Runs a small edit-distance DP over the reversed pattern
+    and reversed text so the window is anchored at its end.
+    Returns (start, distance).
+    """
+    rp = pattern[::-1]
+    rt = text[max(0, end - len(pattern) - max_errors + 1):end + 1][::-1]
+
+    previous = list(range(len(rt) + 1))  # row for the empty pattern prefix
+    for i in range(1, len(rp) + 1):
+        current = [i] + [0] * len(rt)
+        for j in range(1, len(rt) + 1):
+            cost = 0 if rp[i - 1] == rt[j - 1] else 1
+            current[j] = min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + cost)
+        previous = current
+
+    # Prefer the smallest distance, then the window closest to the pattern length
+    length = min(range(len(rt) + 1), key=lambda j: (previous[j], abs(j - len(rp))))
+    return end - length + 1, previous[length]
+
+
+class ContourMatcher:
+    """
+    k-errors substring search over every voice contour, using Myers'
+    bit-parallel edit-distance algorithm. The bit vectors of all contours are
+    advanced together one text column at a time with NumPy, so extra voices
+    widen each step rather than adding steps. Identical contours (doubled
+    parts, repeated pieces) are scanned once and shared by their owners.
+    """
+
+    def __init__(self, entries):
+        owners = {}
+        for key, voice, packed in entries:
+            owners.setdefault(bytes(packed), []).append((key, voice))
+        # The text stays 2-bit packed; each column reads its codes straight from the words
+        self.packed = PackedContours((None, None, packed) for packed in owners)
+        # Longest first, so the contours still active at column j are a prefix
+        self.order = np.argsort(-self.packed.lengths, kind="stable")
+        groups = list(owners.values())
+        self.owners = [groups[i] for i in self.order.tolist()]
+        self.ids = {owner: doc_id for doc_id, entry_owners in enumerate(self.owners) for owner in entry_owners}
+        self.lengths = self.packed.lengths[self.order]
+        self.offsets = self.packed.starts[self.order]
+
+    def __len__(self):
+        return len(self.ids)
+
+    def distances(self, pattern):
+        """
+        Runs Myers' algorithm over every distinct contour at once. Returns, per
+        contour, the lowest edit distance of the pattern against any substring
+        and the text position where the best window ends.
+        """
+        m = len(pattern)
+        n_docs = len(self.owners)
+        best = np.full(n_docs, m, dtype=np.int64)
+        best_end = np.full(n_docs, -1, dtype=np.int64)
+        if n_docs == 0:
+            return best, best_end
+
+        # Peq[c] has bit i set where pattern[i] == c; the extra row never matches
+        peq = np.zeros(len(ALPHABET) + 1, dtype=np.uint64)
+        for i, code in enumerate(encode(pattern).tolist()):
+            if code < len(ALPHABET):
+                peq[code] |= _ONE << np.uint64(i)
+        mask = np.uint64((1 << m) - 1)
+        high = _ONE << np.uint64(m - 1)
+
+        pv = np.full(n_docs, mask, dtype=np.uint64)
+        mv = np.zeros(n_docs, dtype=np.uint64)
+        score = np.full(n_docs, m, dtype=np.int64)
+
+        active = n_docs
+        for j in range(int(self.lengths[0])):
+            while active and self.lengths[active - 1] <= j:
+                active -= 1
+            # Fetch the next 32 packed symbols of each contour once, then shift per column
+            column = j % STEPS_PER_WORD
+            if column == 0:
+                block = self.packed.windows(self.offsets[:active] + j)
+            eq = peq[(block[:active] >> np.uint64(2 * column)) & _THREE]
+            p, n = pv[:active], mv[:active]
+
+            xv = eq | n
+            xh = (((eq & p) + p) ^ p) | eq
+            ph = n | ~(xh | p)
+            mh = p & xh
+            score[:active] += ((ph & high) != 0).astype(np.int64) - ((mh & high) != 0).astype(np.int64)
+
+            ph = (ph << _ONE) & mask
+            mh = (mh << _ONE) & mask
+            pv[:active] = (mh | ~(xv | ph)) & mask
+            mv[:active] = ph & xv
+
+            improved = score[:active] < best[:active]
+            best[:active][improved] = score[:active][improved]
+            best_end[:active][improved] = j
+        return best, best_end
+
+    def search(self, query, max_errors, limit=None):
+        """
+        Finds every voice containing a window within max_errors edits of
+        the query. Returns one Match per voice, best distance first. The
+        window start is estimated from its end; align() finds the exact one.
+        Queries longer than MAX_PATTERN_LENGTH are truncated.
+        """
+        pattern = query.upper()[:MAX_PATTERN_LENGTH]
+        if not pattern:
+            return []
+        max_errors = min(max_errors, len(pattern) - 1)
+
+        best, best_end = self.distances(pattern)
+        hits = np.flatnonzero(best <= max_errors)
+        hits = hits[np.argsort(best[hits], kind="stable")]
+
+        matches = [
+            Match(key, max(0, end + 1 - len(pattern)), end + 1, distance, int(self.lengths[doc_id]), voice)
+            for doc_id, end, distance in zip(hits.tolist(), best_end[hits].tolist(), best[hits].tolist())
+            for key, voice in self.owners[doc_id]
+        ]
+        return matches if limit is None else matches[:limit]
+
+    def align(self, match, query, max_errors):
+        """Returns the match with its exact best window start and distance."""
+        pattern = query.upper()[:MAX_PATTERN_LENGTH]
+        contour = self.packed.contour(int(self.order[self.ids[match.key, match.voice]]))
+        start, distance = window_alignment(pattern, contour, match.end - 1, max_errors)
+        return match._replace(start=start, distance=distance)
@@ -0,0 +1,96 @@
+# audio.py
+import io
+import librosa
+import numpy as np
+import os
+import tempfile
+import traceback
+from rhythm import onsets_to_rhythm
+from contour import notes_to_contour
+
+SAMPLE_RATE = 22050
+
+def segment_notes(pitches, magnitudes):
+    """
+    Picks the strongest pitch in every frame of a piptrack result, converts
+    the voiced frames to (fractional) MIDI notes and segments them into a
+    note sequence: a frame starts a new note when it moves more than half a
+    semitone away from the last note.
+    Returns (notes, onset frame of each note).
+    """
+    # Dominant pitch per frame, as whole-array operations
+    index = magnitudes.argmax(axis=0)
+    dominant = np.take_along_axis(pitches, index[np.newaxis, :], axis=0)[0]
+    voiced = np.flatnonzero(dominant > 0)
+    midi_notes = librosa.hz_to_midi(dominant[voiced])
+
+    # Each decision depends on the last note kept, so segmentation stays a
+    # scan, but over plain floats. Exact repeats can never start a note.
+    if midi_notes.size == 0:
+        return [], []
+    changed = np.flatnonzero(np.diff(midi_notes) != 0) + 1
+    notes = [midi_notes[0]]
+    onsets = [int(voiced[0])]
+    last = float(notes[0])
+    for i, midi_note in zip(changed.tolist(), midi_notes[changed].tolist()):
+        if abs(midi_note - last) > 0.5:
+            notes.append(midi_notes[i])
+            onsets.append(int(voiced[i]))
+            last = midi_note
+    return notes, onsets
+
+def dominant_notes(pitches, magnitudes):
+    """The note sequence of segment_notes, without onsets."""
+    return segment_notes(pitches, magnitudes)[0]
+
+def load_audio(data: bytes, filename: str = ""):
+    """
+    Decodes uploaded audio bytes to mono samples at SAMPLE_RATE.
+    Formats libsndfile can read (wav, flac, ogg, ...) decode straight from
+    memory; anything else (e.g. m4a/mp3 from phone recorders) goes through
+    audioread, which needs a real file, so only then is a uniquely named
+    temporary file written.
+    """
+    try:
+        return librosa.load(io.BytesIO(data), sr=SAMPLE_RATE, mono=True)
+    except Exception:
+        pass
+
+    suffix = os.path.splitext(filename or "")[1]
+    with tempfile.NamedTemporaryFile(suffix=suffix) as tmp:
+        tmp.write(data)
+        tmp.flush()
+        return librosa.load(tmp.name, sr=SAMPLE_RATE, mono=True)
+
+def audio_to_contour(data: bytes, filename: str = ""):
+    """
+    Processes uploaded audio bytes to extract a melodic contour and the
+    matching rhythm string from the onset frames of the segmented notes.
+    Returns (contour, rhythm), or (None, None) if no contour was found.
+    """
+    try:
+        # Basic sanity checks
+        if not data:
+            raise ValueError("Uploaded file is empty or unreadable")
+
+        # Decode the audio
+        # Use deterministic params; mono to simplify pitch tracking
+        # If resampling fails with native backends, librosa will raise; we catch below
+        y, sr = load_audio(data, filename)
+        
+        # Get pitches and magnitudes
+        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+        
+        # Select the dominant pitch in each time frame and segment it into notes
+        notes, onsets = segment_notes(pitches, magnitudes)
+
+        # Convert the sequence of notes to a contour and their onsets to a rhythm
+        contour = notes_to_contour(notes)
+        if not contour:
+            return None, None
+        return contour, onsets_to_rhythm(onsets)
+    except Exception as e:
+        # Print full traceback for visibility in logs
+        print(f"Error processing audio: {e}")
+        traceback.print_exc()
+        return None, None
@@ -0,0 +1,66 @@
+# bench_audio_contour.py
+"""
+Compares the per-frame Python loop that audio_to_contour used to run with
+the vectorized dominant_notes, on the piptrack output of one recording.
+
+Run from backend/:  python -m benchmarks.bench_audio_contour [audio_file] [seconds]
+Without an audio file, a synthetic 30-second melody is used.
+"""
+import sys
+import timeit
+import librosa
+import numpy as np
+from audio import dominant_notes
+from contour import notes_to_contour
+
+SR = 22050
+
+
+def dominant_notes_loop(pitches, magnitudes):
+    """The original frame-by-frame implementation, kept as the reference."""
+    notes = []
+    for t in range(pitches.shape[1]):
+        index = magnitudes[:, t].argmax()
+        pitch = pitches[index, t]
+        if pitch > 0:
+            midi_note = librosa.hz_to_midi(pitch)
+            if not notes or abs(midi_note - notes[-1]) > 0.5:
+                notes.append(midi_note)
+    return notes
+
+
+def synthetic_melody(seconds):
+    """A random walk of quarter-second sine tones with a little noise."""
+    rng = np.random.default_rng(0)
+    note_samples = SR // 4
+    steps = rng.integers(-3, 4, size=int(seconds * 4))
+    midi = 62 + np.cumsum(steps) % 24
+    t = np.arange(note_samples) / SR
+    y = np.concatenate([np.sin(2 * np.pi * librosa.midi_to_hz(m) * t) for m in midi])
+    return (0.5 * y + 0.01 * rng.standard_normal(y.size)).astype(np.float32)
+
+
+def main():
+    seconds = float(sys.argv[2]) if len(sys.argv) > 2 else 30.0
+    if len(sys.argv) > 1:
+        y, sr = librosa.load(sys.argv[1], sr=SR, mono=True, duration=seconds)
+    else:
+        y, sr = synthetic_melody(seconds), SR
+    pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
+    print(f"{y.size / sr:.1f}s of audio, {pitches.shape[1]} frames x {pitches.shape[0]} bins")
+
+    loop_contour = notes_to_contour(dominant_notes_loop(pitches, magnitudes))
+    vector_contour = notes_to_contour(dominant_notes(pitches, magnitudes))
+    assert loop_contour == vector_contour, "contours differ"
+    print(f"Contours identical ({len(loop_contour or '')} symbols)")
+
+    runs = 5
+    loop_time = min(timeit.repeat(lambda: dominant_notes_loop(pitches, magnitudes), number=1, repeat=runs))
+    vector_time = min(timeit.repeat(lambda: dominant_notes(pitches, magnitudes), number=1, repeat=runs))
+    print(f"loop:       {loop_time * 1000:8.2f} ms")
+    print(f"vectorized: {vector_time * 1000:8.2f} ms")
+    print(f"speedup:    {loop_time / vector_time:8.1f}x")
+
+
+if __name__ == "__main__":
+    main()
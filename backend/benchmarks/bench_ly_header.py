@@ -0,0 +1,105 @@
+# bench_ly_header.py
+"""
+Compares the whole-file, seven-regex header parser that ingest used to run
+with the streaming single-pattern parse_ly_header, over every .ly file in
+mutopia_files.
+
+Run from backend/:  python -m benchmarks.bench_ly_header
+"""
+import contextlib
+import io
+import os
+import re
+import time
+from pair_parser import SOURCE_DIR, parse_ly_header
+
+
+def parse_ly_header_full(ly_path):
+    """The original implementation, kept as the reference."""
+    metadata = {}
+    try:
+        with open(ly_path, 'r', encoding='utf-8', errors='ignore') as f:
+            content = f.read()
+
+            def pick_first(pattern):
+                m = re.search(pattern, content, re.IGNORECASE | re.DOTALL)
+                return m.group(1).strip() if m else None
+
+            q = r'(?:"([^"]*)"|\'([^\']*)\')'
+
+            title = pick_first(rf'\bmutopiatitle\s*=\s*{q}')
+            if not title:
+                title = pick_first(rf'\btitle\s*=\s*{q}')
+            if title:
+                metadata['title'] = title
+
+            composer = pick_first(rf'\bmutopiacomposer\s*=\s*{q}')
+            if not composer:
+                composer = pick_first(rf'\bcomposer\s*=\s*{q}')
+            if composer:
+                composer = re.sub(r'\s*\([^)]*\)\s*', '', composer).strip()
+                metadata['composer'] = {"name": composer}
+
+            opus = pick_first(rf'\bmutopiaopus\s*=\s*{q}')
+            if not opus:
+                opus = pick_first(rf'\bopus\s*=\s*{q}')
+            if opus and opus != "":
+                metadata['opus'] = opus
+
+            piece = pick_first(rf'\bpiece\s*=\s*{q}')
+            if piece:
+                metadata['piece'] = piece
+
+            date = pick_first(rf'\b(date|mutopiadate)\s*=\s*{q}')
+            if date:
+                year = re.search(r'\b(1[5-9]\d{2}|20\d{2})\b', date)
+                if year:
+                    metadata['year'] = year.group(1)
+    except Exception:
+        pass
+    return metadata
+
+
+def ly_files():
+    for dirpath, _, filenames in os.walk(SOURCE_DIR):
+        for filename in filenames:
+            if filename.endswith('.ly'):
+                yield os.path.join(dirpath, filename)
+
+
+def timed(parser, paths):
+    results = []
+    started = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for path in paths:
+            results.append(parser(path))
+    return time.perf_counter() - started, results
+
+
+def main():
+    paths = sorted(ly_files())
+    total_bytes = sum(os.path.getsize(path) for path in paths)
+    print(f"{len(paths)} .ly files, {total_bytes / 1e6:.1f} MB")
+
+    # Warm the page cache so both parsers read from memory
+    timed(parse_ly_header_full, paths)
+
+    full_time, full = timed(parse_ly_header_full, paths)
+    stream_time, stream = timed(parse_ly_header, paths)
+
+    # The old parser returned the field name for dates, and took `piece`
+    # from later \\score headers, so only the top-level header fields compare
+    fields = ('title', 'composer', 'opus')
+    differ = [path for path, a, b in zip(paths, full, stream)
+              if any(a.get(field) != b.get(field) for field in fields)]
+
+    print(f"full file, 7 regexes: {full_time * 1000:8.1f} ms")
+    print(f"streaming, 1 regex:   {stream_time * 1000:8.1f} ms")
+    print(f"speedup:              {full_time / stream_time:8.1f}x")
+    print(f"files with different title/composer/opus: {len(differ)}")
+    for path in differ[:10]:
+        print(f"  {path}")
+
+
+if __name__ == "__main__":
+    main()
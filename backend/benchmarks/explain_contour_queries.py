@@ -0,0 +1,53 @@
+# explain_contour_queries.py
+"""
+Checks that prefix and exact contour lookups run as index scans: explains
+the contour_filter queries /search/parsons sends for a few queries against
+the live compositions collection and fails if any plan contains a COLLSCAN.
+
+Run from backend/:  python -m benchmarks.explain_contour_queries [query ...]
+Exits with status 1 if a collection scan is found.
+"""
+import sys
+from database import collection_compositions, contour_filter, ensure_indexes
+
+QUERIES = ["*U", "*UUDD", "*RRRRRRRR", "*UDUDUDUDUDUDUDUD"]
+
+
+def plan_stages(plan):
+    """Every stage name in an explain plan, however deeply nested."""
+    if isinstance(plan, dict):
+        if "stage" in plan:
+            yield plan["stage"]
+        for value in plan.values():
+            yield from plan_stages(value)
+    elif isinstance(plan, list):
+        for value in plan:
+            yield from plan_stages(value)
+
+
+def main():
+    queries = [query.upper() if query.startswith("*") else "*" + query.upper() for query in sys.argv[1:]] or QUERIES
+    ensure_indexes(collection_compositions)
+
+    failed = False
+    for mode in ("prefix", "exact"):
+        for query in queries:
+            explain = collection_compositions.find(contour_filter(query, mode)).explain()
+            planner = explain["queryPlanner"]
+            stages = list(plan_stages(planner["winningPlan"]))
+            stats = explain.get("executionStats", {})
+            scan = "COLLSCAN" in stages
+            failed = failed or scan
+            print(f"{'FAIL' if scan else 'ok  '} {mode:6} {query:20} "
+                  f"docs examined {stats.get('totalDocsExamined', '?'):>6}  "
+                  f"keys examined {stats.get('totalKeysExamined', '?'):>6}  "
+                  f"{' > '.join(dict.fromkeys(stages))}")
+
+    if failed:
+        print("A contour lookup fell back to a collection scan; check the melodic_contour and voices.contour indexes.")
+        sys.exit(1)
+    print("Every contour lookup uses an index.")
+
+
+if __name__ == "__main__":
+    main()
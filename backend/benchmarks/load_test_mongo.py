@@ -0,0 +1,86 @@
+# load_test_mongo.py
+"""
+Compares request latency under concurrent clients when the handlers'
+database calls go through the blocking MongoClient (as they used to) and
+through the pooled AsyncMongoClient they now await. Each simulated request
+does the database work of a prefix /search/parsons: a contour_filter lookup,
+then a fetch of the top results by path.
+
+A request counts from the moment its client issues it, so with the blocking
+client it also waits for every other request holding the event loop.
+
+Run from backend/:  python -m benchmarks.load_test_mongo [clients] [requests per client]
+"""
+import asyncio
+import random
+import sys
+import time
+import numpy as np
+from database import MONGO_MAX_POOL_SIZE, collection_compositions, contour_filter, open_async_client
+
+QUERIES = ["*U", "*UD", "*DU", "*RRR", "*UUDD", "*UDUD", "*DDUU", "*URD"]
+LOOKUP_PROJECTION = {"_id": 0, "lilypond_path": 1}
+FETCH_PROJECTION = {"title": 1, "composer": 1, "lilypond_path": 1}
+# Candidates read per lookup, and results fetched per page
+LOOKUP_LIMIT = 200
+PAGE_SIZE = 20
+
+
+async def blocking_request(query):
+    # Nothing is awaited, so both round trips hold the event loop
+    lookup = collection_compositions.find(contour_filter(query, "prefix"), LOOKUP_PROJECTION).limit(LOOKUP_LIMIT)
+    paths = [doc["lilypond_path"] for doc in lookup][:PAGE_SIZE]
+    list(collection_compositions.find({"lilypond_path": {"$in": paths}}, FETCH_PROJECTION))
+
+
+def async_request(collection):
+    async def request(query):
+        lookup = collection.find(contour_filter(query, "prefix"), LOOKUP_PROJECTION).limit(LOOKUP_LIMIT)
+        paths = [doc["lilypond_path"] for doc in await lookup.to_list()][:PAGE_SIZE]
+        await collection.find({"lilypond_path": {"$in": paths}}, FETCH_PROJECTION).to_list()
+    return request
+
+
+async def run(request, clients, per_client):
+    """Runs every client concurrently. Returns (latencies in seconds, wall time)."""
+    latencies = []
+
+    async def client(seed):
+        rng = random.Random(seed)
+        for _ in range(per_client):
+            start = time.perf_counter()
+            # Hand the loop back before starting, as a server does between accepting and handling a request
+            await asyncio.sleep(0)
+            await request(rng.choice(QUERIES))
+            latencies.append(time.perf_counter() - start)
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(seed) for seed in range(clients)))
+    return np.array(latencies), time.perf_counter() - start
+
+
+def report(name, latencies, elapsed):
+    p50, p99 = np.percentile(latencies, [50, 99]) * 1000
+    print(f"{name:9} p50 {p50:8.1f} ms  p99 {p99:8.1f} ms  {len(latencies) / elapsed:7.1f} req/s")
+
+
+async def main():
+    clients = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    per_client = int(sys.argv[2]) if len(sys.argv) > 2 else 20
+    print(f"{clients} clients x {per_client} requests, async pool of {MONGO_MAX_POOL_SIZE} connections")
+
+    client = open_async_client()
+    collection = client.music_db.compositions
+    try:
+        # Warm both clients' connections and the server cache first
+        await run(blocking_request, 1, len(QUERIES))
+        await run(async_request(collection), 1, len(QUERIES))
+
+        report("blocking", *await run(blocking_request, clients, per_client))
+        report("async", *await run(async_request(collection), clients, per_client))
+    finally:
+        await client.close()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
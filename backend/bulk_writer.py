@@ -0,0 +1,89 @@
+# bulk_writer.py
+import time
+from pymongo import InsertOne
+from pymongo.errors import AutoReconnect, BulkWriteError, NetworkTimeout
+
+DUPLICATE_KEY = 11000
+# Write errors worth retrying: the server was unreachable, stepping down or
+# shutting down, the operation timed out, or it hit a write conflict. Any
+# other code (validation, document too large, ...) fails the same way again.
+TRANSIENT_ERRORS = {6, 7, 89, 91, 112, 134, 189, 262, 9001, 10058, 10107, 11600, 11602, 13435, 13436}
+
+
+class BulkWriter:
+    """
+    Buffers write operations and sends them as unordered bulk_write batches
+    instead of one round trip per document. Operations that failed with a
+    transient or network error are retried with backoff; any other error
+    fails the operation at once. A duplicate key on a retried insert means
+    the first attempt already landed.
+    """
+
+    def __init__(self, collection, batch_size=500, max_retries=3):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.max_retries = max_retries
+        self.pending = []
+        self.written = 0
+        self.failed = 0
+        self.batches = 0
+        self.write_seconds = 0.0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.flush()
+
+    def add(self, operation):
+        """Queues a pymongo write operation (InsertOne, ReplaceOne, DeleteOne, ...)."""
+        self.pending.append(operation)
+        if len(self.pending) >= self.batch_size:
+            self.flush()
+
+    def insert(self, document):
+        self.add(InsertOne(document))
+
+    def flush(self):
+        """Writes every queued operation."""
+        if not self.pending:
+            return
+        batch, self.pending = self.pending, []
+        self.batches += 1
+
+        started = time.perf_counter()
+        for attempt in range(self.max_retries + 1):
+            retrying = attempt > 0
+            try:
+                self.collection.bulk_write(batch, ordered=False)
+                self.written += len(batch)
+                batch = []
+                break
+            except BulkWriteError as e:
+                errors = e.details.get("writeErrors", [])
+                failed = {error["index"] for error in errors}
+                # Duplicate keys only count as landed when retrying our own insert
+                landed = {error["index"] for error in errors if retrying and error.get("code") == DUPLICATE_KEY}
+                fatal = failed - landed - {error["index"] for error in errors if error.get("code") in TRANSIENT_ERRORS}
+                self.written += len(batch) - len(failed) + len(landed)
+                self.failed += len(fatal)
+                for error in errors:
+                    if error["index"] in fatal:
+                        print(f"    - Write failed: {error.get('errmsg')}")
+                batch = [op for i, op in enumerate(batch) if i in failed and i not in landed and i not in fatal]
+            except (AutoReconnect, NetworkTimeout) as e:
+                print(f"    - Batch write interrupted ({e}), retrying")
+            if not batch:
+                break
+            time.sleep(0.5 * 2 ** attempt)
+
+        if batch:
+            self.failed += len(batch)
+            print(f"    - Gave up on {len(batch)} operation(s) after {self.max_retries} retries")
+        self.write_seconds += time.perf_counter() - started
+
+    def report(self):
+        """One-line summary of write throughput."""
+        rate = self.written / self.write_seconds if self.write_seconds else 0.0
+        return (f"Wrote {self.written} operation(s) in {self.batches} batch(es), "
+                f"{self.failed} failed, {rate:.0f} ops/s over {self.write_seconds:.2f}s of writes")
@@ -0,0 +1,22 @@
+# contour.py
+
+
+def notes_to_contour(notes):
+    """
+    Converts a list of pitches (MIDI notes, possibly fractional) to a
+    melodic contour string (Parsons code): '*' then U(p), D(own) or
+    R(epeat) for each note after the first. Returns None for fewer than two.
+    """
+    if len(notes) < 2:
+        return None
+
+    contour = ["*"]
+    for i in range(1, len(notes)):
+        if notes[i] > notes[i-1]:
+            contour.append("U") # Up
+        elif notes[i] < notes[i-1]:
+            contour.append("D") # Down
+        else:
+            contour.append("R") # Repeat
+
+    return "".join(contour)
@@ -0,0 +1,57 @@
+# corpus.py
+import numpy as np
+from ranking import Match
+
+# Joins contours in the corpus text; never appears in a query
+SEPARATOR = b"|"
+# Stored voice number of a composition's main melody (voice None)
+MELODY_VOICE = -1
+
+
+def join_contours(entries):
+    """
+    Joins the contours of (key, voice, contour) entries into one text, each
+    followed by a separator. Returns (keys, stored voices, starts, text).
+    """
+    keys, voices, starts, parts = [], [], [], []
+    position = 0
+    for key, voice, contour in entries:
+        keys.append(key)
+        voices.append(MELODY_VOICE if voice is None else voice)
+        starts.append(position)
+        parts.append(contour.upper().encode("ascii"))
+        position += len(parts[-1]) + len(SEPARATOR)
+    return keys, voices, starts, SEPARATOR.join(parts) + SEPARATOR
+
+
+def entry_offsets(starts, positions):
+    """(entry id, offset) pairs for sorted text positions, given the start of each entry."""
+    positions = np.asarray(positions, dtype=np.int64)
+    entry_ids = np.searchsorted(starts, positions, side="right") - 1
+    return list(zip(entry_ids.tolist(), (positions - starts[entry_ids]).tolist()))
+
+
+class ContourSearch:
+    """
+    Substring search shared by the contour engines. A subclass provides
+    keys, voices and lengths per entry, and locate(query) returning sorted
+    (entry id, offset) pairs for every occurrence.
+    """
+
+    def search(self, query, limit=None):
+        """
+        Finds every voice whose contour contains the query as a substring.
+        Returns one Match per voice, at its first occurrence, stopping after
+        `limit` voices.
+        """
+        matches = []
+        last = None
+        for entry_id, offset in self.locate(query):
+            if entry_id == last:
+                continue
+            last = entry_id
+            matches.append(Match(self.keys[entry_id], offset, offset + len(query), 0, int(self.lengths[entry_id]),
+                                 self.voices[entry_id]))
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
@@ -1,15 +1,121 @@
 import os
+import re
+import uuid
+from datetime import datetime, timezone
 from dotenv import load_dotenv
-from pymongo import MongoClient
+from pymongo import AsyncMongoClient, MongoClient
 
 # Load environment variables from .env file
 load_dotenv()
 
 MONGO_URI = os.getenv("MONGO_URI")
 
-# Create a MongoDB client
-client = MongoClient(MONGO_URI)
+# Connection pool of the API's async client. A request that finds all
+# MONGO_MAX_POOL_SIZE connections busy waits at most MONGO_WAIT_QUEUE_TIMEOUT_MS
+# for one before failing, rather than queueing indefinitely.
+MONGO_MAX_POOL_SIZE = int(os.getenv("MONGO_MAX_POOL_SIZE", 100))
+MONGO_MIN_POOL_SIZE = int(os.getenv("MONGO_MIN_POOL_SIZE", 10))
+MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.getenv("MONGO_WAIT_QUEUE_TIMEOUT_MS", 2000))
+
+# Create a MongoDB client (ingest, scripts and index builds at API startup).
+# connect=False defers DNS resolution and monitor threads to the first
+# operation, so processes that merely import this module stay cheap.
+client = MongoClient(MONGO_URI, connect=False)
 
 # Get a reference to the database and collection
 db = client.music_db
-collection_compositions = db.compositions
\ No newline at end of file
+collection_compositions = db.compositions
+
+# A full ingest is written to the staging collection and then renamed over
+# the live one; the generation it replaced is kept in previous for rollback
+collection_staging = db.compositions_staging
+collection_previous = db.compositions_previous
+
+# Small bookkeeping documents. The catalog document, written whenever an
+# ingest or rollback finishes, holds the composition count the API's health
+# checks read instead of counting, and a generation id that changes with
+# every write so the API knows to reload its in-memory search indexes.
+collection_meta = db.meta
+CATALOG_ID = "catalog"
+
+def open_async_client():
+    """
+    Creates the AsyncMongoClient the API's request handlers await. It binds
+    to the event loop it is first used on, so open it from inside the
+    running loop (a startup hook), not at import time.
+    """
+    return AsyncMongoClient(MONGO_URI, maxPoolSize=MONGO_MAX_POOL_SIZE, minPoolSize=MONGO_MIN_POOL_SIZE,
+                            waitQueueTimeoutMS=MONGO_WAIT_QUEUE_TIMEOUT_MS)
+
+def record_generation(collection=collection_compositions):
+    """
+    Marks the collection's contents as a new catalog generation: stores a
+    fresh generation id and the exact composition count in the meta
+    collection. Returns the count.
+    """
+    count = collection.count_documents({})
+    collection_meta.replace_one({"_id": CATALOG_ID}, {
+        "generation": uuid.uuid4().hex,
+        "count": count,
+        "updated_at": datetime.now(timezone.utc),
+    }, upsert=True)
+    return count
+
+# Ways /search/parsons can match a query against a contour
+CONTOUR_MODES = ("substring", "prefix", "exact")
+
+def ensure_indexes(collection):
+    """Creates the indexes ingest and search rely on (no-op if they exist)."""
+    # Ingest upserts and deletes compositions by their LilyPond path
+    collection.create_index("lilypond_path", unique=True)
+    # Prefix and exact contour lookups are range scans over these
+    collection.create_index("melodic_contour")
+    collection.create_index("voices.contour")
+
+def contour_filter(contour, mode):
+    """
+    MongoDB filter for compositions whose melody or one of whose voices
+    starts with ("prefix") or equals ("exact") the contour. Contours are
+    stored uppercase, so the regex is case-sensitive and anchored, which
+    lets both branches run as range scans over the contour indexes.
+    """
+    if mode == "prefix":
+        condition = {"$regex": "^" + re.escape(contour)}
+    elif mode == "exact":
+        condition = contour
+    else:
+        raise ValueError(f"no index lookup for {mode} mode")
+    return {"$or": [{"melodic_contour": condition}, {"voices.contour": condition}]}
+
+def _voice_entries(collection, field, voice_field):
+    """
+    Yields (lilypond_path, voice, value) for a per-voice field: the main
+    melody's `field` with voice None, then `voice_field` of each entry of the
+    voices list by index. Missing or empty values are skipped.
+    """
+    cursor = collection.find({}, {"_id": 0, "lilypond_path": 1, field: 1, f"voices.{voice_field}": 1})
+    for doc in cursor:
+        if doc.get(field):
+            yield doc["lilypond_path"], None, doc[field]
+        for voice, entry in enumerate(doc.get("voices") or []):
+            if entry.get(voice_field):
+                yield doc["lilypond_path"], voice, entry[voice_field]
+
+def contour_entries(collection):
+    """Yields (lilypond_path, voice, contour) for every searchable contour."""
+    for path, voice, contour in _voice_entries(collection, "melodic_contour", "contour"):
+        yield path, voice, contour.upper()
+
+def interval_entries(collection):
+    """Yields (lilypond_path, voice, intervals) for every stored interval sequence (int8 bytes)."""
+    for path, voice, intervals in _voice_entries(collection, "intervals", "intervals"):
+        yield path, voice, bytes(intervals)
+
+def rhythm_entries(collection):
+    """Yields (lilypond_path, voice, rhythm) for every stored rhythm string."""
+    return _voice_entries(collection, "rhythm", "rhythm")
+
+def packed_entries(collection):
+    """Yields (lilypond_path, voice, packed contour bytes) for every searchable contour."""
+    for path, voice, packed in _voice_entries(collection, "contour_packed", "contour_packed"):
+        yield path, voice, bytes(packed)
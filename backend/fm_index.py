@@ -0,0 +1,178 @@
+# fm_index.py
+import mmap
+import os
+import struct
+import numpy as np
+from suffix_array import INDEX_DIR, build_suffix_array
+from corpus import SEPARATOR, MELODY_VOICE, join_contours, entry_offsets, ContourSearch
+
+FM_INDEX_FILE = os.path.join(INDEX_DIR, "contour.fmi")
+
+MAGIC = b"FMIDX002"
+HEADER = struct.Struct("<8s5Q")  # magic, text length, documents, sample rate, samples, keys bytes
+
+# Symbol codes follow byte order so they sort exactly like the suffix array
+TERMINATOR = b"\x00"
+ALPHABET = TERMINATOR + b"*DRU" + SEPARATOR
+SIGMA = len(ALPHABET)
+CODES = {symbol: code for code, symbol in enumerate(ALPHABET)}
+
+BLOCK = 64        # rows between rank checkpoints
+SAMPLE_RATE = 16  # keep the suffix array entry of every 16th text position
+
+
+def _aligned(size):
+    return (size + 7) & ~7
+
+
+def write_fm_index(entries, path=FM_INDEX_FILE):
+    """
+    Builds an FM-index over (key, voice, contour) entries and writes it as one
+    flat binary file: header, C array, BWT, rank checkpoints, sampled suffix
+    array, entry starts, voices and keys. Every section is 8-byte aligned for
+    mmap.
+    """
+    keys, voices, starts, text = join_contours(entries)
+    text += TERMINATOR
+    n = len(text)
+
+    sa = build_suffix_array(text).astype(np.int64)
+    lut = np.zeros(256, dtype=np.uint8)
+    for symbol, code in CODES.items():
+        lut[symbol] = code
+    codes = lut[np.frombuffer(text, dtype=np.uint8)]
+    bwt = codes[sa - 1]  # sa == 0 wraps to the terminator
+
+    counts = np.bincount(codes, minlength=SIGMA)
+    c_array = np.concatenate(([0], np.cumsum(counts)[:-1])).astype(np.uint64)
+
+    # occ[b, c] = occurrences of c in bwt[:b * BLOCK]
+    n_blocks = n // BLOCK + 1
+    occ = np.zeros((n_blocks, SIGMA), dtype=np.uint32)
+    for code in range(SIGMA):
+        occ[1:, code] = np.cumsum(bwt == code)[BLOCK - 1::BLOCK][:n_blocks - 1]
+
+    marked = (sa % SAMPLE_RATE) == 0
+    marks = np.packbits(np.concatenate((marked, np.zeros(n_blocks * BLOCK - n, dtype=bool))))
+    mark_rank = np.zeros(n_blocks, dtype=np.uint32)
+    mark_rank[1:] = np.cumsum(marked)[BLOCK - 1::BLOCK][:n_blocks - 1]
+    samples = sa[marked].astype(np.uint32)
+
+    key_blob = "\n".join(keys).encode("utf-8")
+    # Pad the BWT by one block so rank windows never read past its end
+    bwt_padded = np.concatenate((bwt, np.full(BLOCK, 0xFF, dtype=np.uint8)))
+
+    # API workers keep the old file mapped; writing a new file and renaming it
+    # over the path leaves them reading the old inode instead of a torn one
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = path + ".tmp"
+    with open(temp_path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, n, len(keys), SAMPLE_RATE, len(samples), len(key_blob)))
+        for section in (c_array, bwt_padded, occ, marks, mark_rank, samples, np.array(starts, dtype=np.uint64),
+                        np.array(voices, dtype=np.int32)):
+            raw = section.tobytes()
+            f.write(raw + b"\x00" * (_aligned(len(raw)) - len(raw)))
+        f.write(key_blob)
+    os.replace(temp_path, path)
+
+
+class FMIndex(ContourSearch):
+    """
+    Read-only FM-index opened with mmap. All arrays are views into the mapped
+    file, so several worker processes share one page-cached copy.
+    """
+
+    def __init__(self, path=FM_INDEX_FILE):
+        self._file = open(path, "rb")
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, n, n_docs, rate, n_samples, keys_len = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC:
+            raise ValueError(f"{path} is not an FM-index file")
+
+        self.n = n
+        self.sample_rate = rate
+        n_blocks = n // BLOCK + 1
+        offset = HEADER.size
+
+        def section(dtype, count):
+            nonlocal offset
+            array = np.frombuffer(self._map, dtype=dtype, count=count, offset=offset)
+            offset += _aligned(array.nbytes)
+            return array
+
+        self.c_array = section(np.uint64, SIGMA).astype(np.int64)
+        self.bwt = section(np.uint8, n + BLOCK)
+        self.occ = section(np.uint32, n_blocks * SIGMA).reshape(n_blocks, SIGMA)
+        self.marks = section(np.uint8, n_blocks * BLOCK // 8)
+        self.mark_rank = section(np.uint32, n_blocks)
+        self.samples = section(np.uint32, n_samples)
+        self.starts = section(np.uint64, n_docs).astype(np.int64)
+        self.voices = [None if voice == MELODY_VOICE else voice for voice in section(np.int32, n_docs).tolist()]
+        self.keys = self._map[offset:offset + keys_len].decode("utf-8").split("\n") if n_docs else []
+        # Contour lengths, from the next start (or the terminator) minus a separator
+        self.lengths = np.diff(np.append(self.starts, n - len(TERMINATOR))) - len(SEPARATOR)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _rank(self, code, i):
+        """Occurrences of code in bwt[:i]."""
+        block = i // BLOCK
+        start = block * BLOCK
+        return int(self.occ[block, code]) + int(np.count_nonzero(self.bwt[start:i] == code))
+
+    def _rank_many(self, codes, rows):
+        """Vectorized _rank over arrays of codes and rows."""
+        blocks = rows // BLOCK
+        window = self.bwt[(blocks * BLOCK)[:, None] + np.arange(BLOCK)]
+        before = np.arange(BLOCK) < (rows % BLOCK)[:, None]
+        return self.occ[blocks, codes].astype(np.int64) + ((window == codes[:, None]) & before).sum(axis=1)
+
+    def _range(self, query):
+        """Backward search: the [sp, ep) BWT rows of suffixes starting with the query."""
+        pattern = query.upper().encode("ascii", errors="replace")
+        if not pattern or any(symbol not in b"*DRU" for symbol in pattern):
+            return 0, 0
+
+        sp, ep = 0, self.n
+        for symbol in reversed(pattern):
+            code = CODES[symbol]
+            sp = int(self.c_array[code]) + self._rank(code, sp)
+            ep = int(self.c_array[code]) + self._rank(code, ep)
+            if sp >= ep:
+                return 0, 0
+        return sp, ep
+
+    def count(self, query):
+        """Number of occurrences of the query across all contours."""
+        sp, ep = self._range(query)
+        return ep - sp
+
+    def _text_positions(self, rows):
+        """Walks LF from each row to the nearest sampled row to recover text positions."""
+        rows = rows.astype(np.int64)
+        steps = np.zeros(rows.size, dtype=np.int64)
+        positions = np.empty(rows.size, dtype=np.int64)
+        pending = np.arange(rows.size)
+        while pending.size:
+            current = rows[pending]
+            marked = (self.marks[current >> 3] >> (7 - (current & 7))) & 1
+            hit = marked.astype(bool)
+            if hit.any():
+                done, found = pending[hit], current[hit]
+                bits = np.unpackbits(self.marks[((found // BLOCK) * 8)[:, None] + np.arange(8)], axis=1)
+                below = (bits.astype(bool) & (np.arange(BLOCK) < (found % BLOCK)[:, None])).sum(axis=1)
+                sample = self.mark_rank[found // BLOCK].astype(np.int64) + below
+                positions[done] = self.samples[sample].astype(np.int64) + steps[done]
+            pending = pending[~hit]
+            if pending.size:
+                current = rows[pending]
+                codes = self.bwt[current].astype(np.int64)
+                rows[pending] = self.c_array[codes] + self._rank_many(codes, current)
+                steps[pending] += 1
+        return positions
+
+    def locate(self, query):
+        """Sorted (entry id, offset) pairs for every occurrence of the query."""
+        sp, ep = self._range(query)
+        return entry_offsets(self.starts, np.sort(self._text_positions(np.arange(sp, ep))))
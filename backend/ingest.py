@@ -1,208 +1,238 @@
 # ingest.py
+import argparse
+import multiprocessing
 import os
-import re
-import mido
-from database import collection_compositions
-
-SOURCE_DIR = "mutopia_files"
+from functools import partial
+from pymongo import DeleteOne, ReplaceOne
+from database import db, collection_compositions, collection_staging, collection_previous, ensure_indexes, contour_entries
+from database import record_generation
+from bulk_writer import BulkWriter
+from melody import MELODY_EXTRACTORS, DEFAULT_MELODY
+from pair_parser import SOURCE_DIR, process_pair
+from manifest import load_manifest, save_manifest, fingerprint, same_files, MANIFEST_FILE
+from suffix_array import SuffixArrayIndex, SUFFIX_ARRAY_FILE, CONTOUR_ENGINE
+from fm_index import write_fm_index, FM_INDEX_FILE
+
+# A full rebuild is not swapped in if it would shrink the catalog below this
+# fraction of the live collection
+MIN_SWAP_RATIO = 0.9
 # -----------------------------
 
-COMPOSERS = {
-    "Johann Sebastian Bach",
-    "Béla Bartók",
-    "Johannes Brahms",
-    "Max Bruch",
-    "Anton Bruckner",
-    "Ludwig van Beethoven",
-    "Frédéric Chopin",
-    "Carl Czerny",
-    "Claude Debussy",
-    "Antonín Dvořák",
-    "Gabriel Fauré",
-    "César Franck",
-    "Edvard Grieg",
-    "Joseph Haydn",
-    "George Frideric Handel",
-    "Franz Liszt",
-    "Wolfgang Amadeus Mozart",
-    "Felix Mendelssohn",
-    "Modest Mussorgsky",
-    "Niccolò Paganini",
-    "Sergei Rachmaninoff",
-    "Jean-Philippe Rameau",
-    "Nikolai Rimsky-Korsakov",
-    "Camille Saint-Saëns",
-    "Franz Schubert",
-    "Erik Satie",
-    "Domenico Scarlatti",
-    "Robert Schumann",
-    "Alexander Scriabin",
-    "Richard Strauss",
-    "Pyotr Ilyich Tchaikovsky",
-    "Tomaso Antonio Vitali",
-    "Antonio Vivaldi",
-}
-
-def parse_ly_header(ly_path):
+def build_contour_indexes():
     """
-    Reads a .ly file and uses regex to extract metadata from the header.
-    Returns a dictionary with the found metadata.
+    Builds the on-disk index of the configured CONTOUR_ENGINE from every
+    composition in the database, so the API can load it at startup instead
+    of rebuilding. The other engine's file is removed, since it would no
+    longer match the database.
     """
-    try:
-        with open(ly_path, 'r', encoding='utf-8', errors='ignore') as f:
-            content = f.read()
-
-            def pick_first(pattern):
-                m = re.search(pattern, content, re.IGNORECASE | re.DOTALL)
-                return m.group(1).strip() if m else None
-
-            # allow '...' or "..."
-            q = r'(?:"([^"]*)"|\'([^\']*)\')'  # capture either quotes; pick whichever group matched later
-
-            metadata = {}
-
-            # Check mutopia fields first, then fall back to regular fields
-            title = pick_first(rf'\bmutopiatitle\s*=\s*{q}')
-            if not title:
-                title = pick_first(rf'\btitle\s*=\s*{q}')
-            if title:
-                metadata['title'] = title
-
-            # Check mutopiacomposer first, then fall back to composer
-            composer = pick_first(rf'\bmutopiacomposer\s*=\s*{q}')
-            if not composer:
-                composer = pick_first(rf'\bcomposer\s*=\s*{q}')
-            if composer:
-                # strip dates/parentheses and excessive whitespace, e.g. "Franz Abt (1819-1885)" -> "Franz Abt"
-                composer = re.sub(r'\s*\([^)]*\)\s*', '', composer).strip()
-                metadata['composer'] = {"name": composer}
-
-            # Check mutopiaopus first, then fall back to opus
-            opus = pick_first(rf'\bmutopiaopus\s*=\s*{q}')
-            if not opus:
-                opus = pick_first(rf'\bopus\s*=\s*{q}')
-            if opus and opus != "":
-                metadata['opus'] = opus
-
-            piece = pick_first(rf'\bpiece\s*=\s*{q}')
-            if piece:
-                metadata['piece'] = piece  # can be useful as subtitle/part name
-
-            date = pick_first(rf'\b(date|mutopiadate)\s*=\s*{q}')
-            if date:
-                # extract 4-digit year if present
-                year = re.search(r'\b(1[5-9]\d{2}|20\d{2})\b', date)
-                if year:
-                    metadata['year'] = year.group(1)
-
-    except Exception as e:
-        print(f"    - Could not parse header from {ly_path}: {e}")
+    files = {"fm-index": FM_INDEX_FILE, "suffix-array": SUFFIX_ARRAY_FILE}
+    for engine, path in files.items():
+        if engine != CONTOUR_ENGINE and os.path.exists(path):
+            os.remove(path)
+    if CONTOUR_ENGINE not in files:
+        print(f"Contour engine is {CONTOUR_ENGINE}; no on-disk index to build")
+        return
+
+    print(f"Building contour index ({CONTOUR_ENGINE})...")
+    entries = list(contour_entries(collection_compositions))
+    if CONTOUR_ENGINE == "fm-index":
+        write_fm_index(entries, FM_INDEX_FILE)
+    else:
+        SuffixArrayIndex.build(entries).save(SUFFIX_ARRAY_FILE)
+    print(f"    > Wrote {len(entries)} voice contours to {files[CONTOUR_ENGINE]}")
+
+def find_pairs():
+    """Yields (dirpath, ly_path, mid_path) for every directory holding both files."""
+    for dirpath, _, filenames in os.walk(SOURCE_DIR):
+        ly_files = [f for f in filenames if f.endswith('.ly')]
+        mid_files = [f for f in filenames if f.endswith('.mid')]
         
-    print(f"Metadata: {metadata}")
-    return metadata
+        if ly_files and mid_files:
+            yield dirpath, os.path.join(dirpath, ly_files[0]), os.path.join(dirpath, mid_files[0])
 
-def midi_to_contour(midi_path):
-    """
-    Parses a MIDI file to extract the main melody and converts it 
-    to a melodic contour string (Parsons code).
+def process_pairs(pairs, workers, melody=DEFAULT_MELODY):
     """
-    try:
-        mid = mido.MidiFile(midi_path)
-        notes = []
-
-        # Find the track with the most note_on events (likely the melody)
-        melody_track = max(mid.tracks, key=lambda t: len([msg for msg in t if msg.type == 'note_on']))
-
-        for msg in melody_track:
-            if msg.type == 'note_on' and msg.velocity > 0:
-                notes.append(msg.note)
-
-        if len(notes) < 2:
-            return None
-
-        # Convert the list of notes to a contour string
-        contour = ["*"]
-        for i in range(1, len(notes)):
-            if notes[i] > notes[i-1]:
-                contour.append("U") # Up
-            elif notes[i] < notes[i-1]:
-                contour.append("D") # Down
-            else:
-                contour.append("R") # Repeat
-        
-        return "".join(contour)
-
-    except Exception as e:
-        print(f"    - Could not process MIDI {midi_path}: {e}")
-        return None
-
-def resolve_composer_only(composer: str | None) -> str | None:
-    """Resolve composer:
-    - Only if the provided string contains the LAST NAME of a composer in COMPOSERS
-    - Returns the full canonical name from COMPOSERS, else None
+    Yields process_pair results. With more than one worker the pairs are
+    spread over a process pool and results arrive in completion order.
     """
-    if not composer:
-        return None
-
-    # 1) Allowlist match → return canonical form
-    lc = composer.lower()
-    for c in COMPOSERS:
-        last = c.split()[-1].lower()
-        if last in lc:
-            return c
+    process = partial(process_pair, melody=melody)
+    if workers <= 1:
+        yield from map(process, pairs)
+        return
+
+    # spawn, not fork: this process holds a MongoDB client. Workers only need
+    # pair_parser, which never imports the database module; re-importing this
+    # script as __mp_main__ creates the client lazily (connect=False), so no
+    # worker resolves DNS or starts monitor threads
+    with multiprocessing.get_context("spawn").Pool(workers) as pool:
+        yield from pool.imap_unordered(process, pairs, chunksize=8)
+
+def validate_staging(expected, allow_shrink=False):
+    """Returns why the staging collection must not go live, or None if it can."""
+    count = collection_staging.count_documents({})
+    if count == 0:
+        return "staging collection is empty"
+    if count != expected:
+        return f"staging has {count} documents, expected {expected}"
+    live = collection_compositions.estimated_document_count()
+    if not allow_shrink and count < MIN_SWAP_RATIO * live:
+        return f"staging has {count} documents, live has {live}"
     return None
 
-def populate_database():
+def swap_in_staging():
     """
-    Walks the local directory, parses files, enriches with MusicBrainz data,
-    and inserts the final documents into MongoDB.
+    Makes the staging collection live. The live generation is first copied
+    (not moved) to the previous collection, so readers never find it missing,
+    then renameCollection with dropTarget replaces it in one atomic step.
     """
+    if collection_compositions.name in db.list_collection_names():
+        collection_compositions.aggregate([{"$out": collection_previous.name}])
+        # $out copies documents but not indexes; a rollback must go live with them
+        ensure_indexes(collection_previous)
+    collection_staging.rename(collection_compositions.name, dropTarget=True)
 
-    print("Starting database population...")
-    collection_compositions.delete_many({})
+def rebuild_collection(pairs, manifest, workers, batch_size, melody, allow_shrink=False):
+    """
+    Writes every pair into the staging collection, indexes and validates it,
+    then swaps it in for the live collection. Searches keep hitting the
+    complete previous generation for the whole rebuild.
+    Returns True if the new generation went live.
+    """
+    collection_staging.drop()
+    ensure_indexes(collection_staging)
 
-    for dirpath, _, filenames in os.walk(SOURCE_DIR):
-        ly_files = [f for f in filenames if f.endswith('.ly')]
-        mid_files = [f for f in filenames if f.endswith('.mid')]
-        
-        if ly_files and mid_files:
-            ly_path = os.path.join(dirpath, ly_files[0])
-            mid_path = os.path.join(dirpath, mid_files[0])
-            
-            print(f"Processing pair in {dirpath}")
-
-            header = parse_ly_header(ly_path)
-            title = header.get('title')
-            header_composer = header.get('composer', {}).get('name')
-            year = header.get('year')
-            work_type_hint = header.get('piece')  # sometimes “Andante”, “Pavan”, etc.
-
-            # Resolve composer only (allowlist → MB artists), keep raw mutopia-first title
-            resolved_composer = resolve_composer_only(header_composer)
-            if not resolved_composer:
-                print("    -> Skipping: could not resolve composer for", dirpath)
+    expected = 0
+    with BulkWriter(collection_staging, batch_size=batch_size) as writer:
+        for dirpath, document in process_pairs(pairs, workers, melody):
+            if document is None:
                 continue
-
-            final_metadata = {
-                "title": title or "Unknown Title",
-                "composer": {"name": resolved_composer}
-            }
-
-            contour = midi_to_contour(mid_path)
-            if not contour:
-                print("    -> Could not generate contour. Skipping.")
+            writer.insert(document)
+            manifest[dirpath]["lilypond_path"] = document["lilypond_path"]
+            expected += 1
+            print(f"    > Queued '{document['title']}'")
+    print(f"    > {writer.report()}")
+
+    problem = validate_staging(expected, allow_shrink)
+    if problem:
+        print(f"    > Not swapping in the rebuild: {problem}. The live collection is unchanged.")
+        return False
+    swap_in_staging()
+    print(f"    > Swapped in {expected} compositions; the old generation is in {collection_previous.name}")
+    return True
+
+def update_collection(pairs, removed, previous, manifest, workers, batch_size, melody):
+    """
+    Upserts the changed pairs into the live collection by lilypond_path and
+    deletes compositions whose pair disappeared or is now skipped.
+    Returns True if every write succeeded.
+    """
+    with BulkWriter(collection_compositions, batch_size=batch_size) as writer:
+        for dirpath, document in process_pairs(pairs, workers, melody):
+            old_path = previous.get(dirpath, {}).get("lilypond_path")
+            new_path = document["lilypond_path"] if document else None
+            if old_path and old_path != new_path:
+                writer.add(DeleteOne({"lilypond_path": old_path}))
+            if document is None:
                 continue
+            writer.add(ReplaceOne({"lilypond_path": new_path}, document, upsert=True))
+            manifest[dirpath]["lilypond_path"] = new_path
+            print(f"    > Queued '{document['title']}'")
 
-            document = {
-                "title": final_metadata.get('title', 'Unknown Title'),
-                "composer": final_metadata.get('composer', {"name": "Unknown Composer"}),
-                "melodic_contour": contour,
-                "lilypond_path": os.path.relpath(ly_path, SOURCE_DIR).replace('\\', '/')
-            }
-            collection_compositions.insert_one(document)
-            print(f"    > Inserted '{document['title']}'")
+        for path in removed:
+            writer.add(DeleteOne({"lilypond_path": path}))
             
+    print(f"    > {writer.report()}")
+    return not writer.failed
+
+def populate_database(workers=1, batch_size=500, full=False, allow_shrink=False, melody=DEFAULT_MELODY):
+    """
+    Walks the local directory, parses files, enriches with MusicBrainz data,
+    and stores the final documents in MongoDB.
+
+    Only pairs whose .ly/.mid contents changed since the manifest of the last
+    run are parsed again and upserted by lilypond_path, and compositions whose
+    pair disappeared are deleted. `full` (or a missing manifest) re-parses
+    everything into a staging collection that is swapped in when complete.
+    Parsing runs on `workers` processes while this process is the single
+    writer, sending operations in bulk batches of `batch_size`. `melody`
+    names the extractor in MELODY_EXTRACTORS; switching it re-parses all.
+    """
+
+    settings = {"melody": melody}
+    previous = {} if full else load_manifest(settings=settings)
+    full = full or not previous
+    print(f"Starting {'full' if full else 'incremental'} database population with {workers} worker(s), "
+          f"{melody} melody extraction...")
+    ensure_indexes(collection_compositions)
+
+    # Fingerprint every pair; mtime and size spare re-hashing untouched files
+    manifest = {}
+    changed = []
+    for pair in find_pairs():
+        dirpath = pair[0]
+        old = previous.get(dirpath)
+        files = fingerprint(pair[1], pair[2], old and old["files"])
+        if old and same_files(old["files"], files):
+            manifest[dirpath] = dict(old, files=files)
+        else:
+            manifest[dirpath] = {"files": files, "lilypond_path": None}
+            changed.append(pair)
+    removed = [entry["lilypond_path"] for dirpath, entry in previous.items()
+               if dirpath not in manifest and entry.get("lilypond_path")]
+    print(f"    > {len(changed)} of {len(manifest)} pairs changed, {len(removed)} removed")
+
+    if not (full or changed or removed):
+        save_manifest(manifest, settings=settings)
+        print("\nDatabase is up to date!")
+        return
+
+    if full:
+        succeeded = rebuild_collection(changed, manifest, workers, batch_size, melody, allow_shrink)
+    else:
+        succeeded = update_collection(changed, removed, previous, manifest, workers, batch_size, melody)
+
+    if not succeeded:
+        # Leave the manifest alone so the failed pairs are retried next run
+        print(f"    > Not updating {MANIFEST_FILE}: the run did not complete")
+        return
+    save_manifest(manifest, settings=settings)
+    build_contour_indexes()
+    # Last, so the API reloads only once the index files are in place
+    print(f"    > Recorded a new generation of {record_generation()} compositions")
     print("\nDatabase population complete!")
 
+def rollback():
+    """Swaps the previous generation back in after a bad full rebuild."""
+    if collection_previous.name not in db.list_collection_names():
+        print("No previous generation to roll back to.")
+        return
+    collection_previous.rename(collection_compositions.name, dropTarget=True)
+    # A previous generation saved by an older ingest lacks indexes, since $out does not copy them
+    ensure_indexes(collection_compositions)
+    # The manifest describes the generation that was just replaced
+    if os.path.exists(MANIFEST_FILE):
+        os.remove(MANIFEST_FILE)
+    build_contour_indexes()
+    print(f"Rolled back to the previous generation of {record_generation()} compositions; "
+          "the next ingest will be a full rebuild.")
+
 if __name__ == "__main__":
-    populate_database()
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Populate the compositions collection from mutopia_files.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="processes used to parse .ly/.mid pairs (default: CPU count)")
+    parser.add_argument("--batch-size", type=int, default=500,
+                        help="documents per bulk write (default: 500)")
+    parser.add_argument("--melody", choices=sorted(MELODY_EXTRACTORS), default=DEFAULT_MELODY,
+                        help=f"how to pick the melody from each MIDI file (default: {DEFAULT_MELODY})")
+    parser.add_argument("--full", action="store_true",
+                        help="ignore the manifest, rebuild into a staging collection and swap it in")
+    parser.add_argument("--allow-shrink", action="store_true",
+                        help=f"swap in a full rebuild even if it is under {MIN_SWAP_RATIO:.0%}% of the live collection")
+    parser.add_argument("--rollback", action="store_true",
+                        help="restore the generation replaced by the last full rebuild")
+    args = parser.parse_args()
+    if args.rollback:
+        rollback()
+    else:
+        populate_database(workers=args.workers, batch_size=args.batch_size, full=args.full,
+                          allow_shrink=args.allow_shrink, melody=args.melody)
@@ -0,0 +1,136 @@
+# intervals.py
+import re
+import numpy as np
+from ranking import Match
+
+INTERVAL_NGRAM_SIZE = 4
+# Queries may allow each interval to be off by at most this many semitones
+MAX_TOLERANCE = 3
+
+# Interval classes used for the n-gram keys: unison, +-1, +-2, +-3..4,
+# +-5..7 and +-8 or more semitones
+CLASS_EDGES = np.array([-7, -4, -2, -1, 0, 1, 2, 3, 5, 8])
+N_CLASSES = len(CLASS_EDGES) + 1
+# Fills the n-grams that start in the last n - 1 intervals of a sequence,
+# so shorter queries can look up the grams they prefix. Sorts last.
+PAD_CLASS = N_CLASSES
+BASE = N_CLASSES + 1
+
+QUERY_INTERVAL = re.compile(r'[+-]?\d+')
+
+
+def notes_to_intervals(notes):
+    """Semitone steps between consecutive pitches, as int8 bytes."""
+    steps = np.diff(np.asarray(notes, dtype=np.int16))
+    return np.clip(steps, -127, 127).astype(np.int8).tobytes()
+
+
+def parse_intervals(query):
+    """
+    Reads a query such as "2, 2, -4" or "+2 +2 -4" into a list of ints,
+    clipped to the int8 range the stored intervals use.
+    """
+    return [max(-127, min(127, int(step))) for step in QUERY_INTERVAL.findall(query)]
+
+
+def quantize(intervals):
+    """Maps semitone intervals to their interval class (0 .. N_CLASSES - 1)."""
+    return np.searchsorted(CLASS_EDGES, intervals, side="right")
+
+
+def gram_codes(classes, n):
+    """
+    Encodes the length-n window of interval classes starting at every
+    interval as one integer, padding past the end with PAD_CLASS.
+    """
+    padded = np.concatenate((np.asarray(classes, dtype=np.int64), np.full(n - 1, PAD_CLASS, dtype=np.int64)))
+    windows = np.lib.stride_tricks.sliding_window_view(padded, n)
+    return windows @ (BASE ** np.arange(n - 1, -1, -1))
+
+
+class IntervalIndex:
+    """
+    Inverted index from n-grams of quantized intervals to the entries that
+    contain them, stored as one sorted posting array with offsets per gram.
+    A query keeps only the entries containing every one of its n-grams (or,
+    with a tolerance, one of the n-grams each window could round to) and
+    verifies just those against the exact semitone values. Queries shorter
+    than n look up the contiguous range of grams they prefix.
+    """
+
+    def __init__(self, entries, n=INTERVAL_NGRAM_SIZE):
+        self.n = n
+        self.keys, self.voices, self.intervals = [], [], []
+        for key, voice, intervals in entries:
+            self.keys.append(key)
+            self.voices.append(voice)
+            self.intervals.append(np.frombuffer(intervals, dtype=np.int8).astype(np.int16))
+
+        # Distinct (gram, entry) pairs, sorted by gram then entry
+        codes = [gram_codes(quantize(intervals), n) for intervals in self.intervals]
+        entry_ids = np.repeat(np.arange(len(codes), dtype=np.int64), [c.size for c in codes])
+        codes = np.concatenate(codes) if codes else np.zeros(0, dtype=np.int64)
+        pairs = np.unique(codes * max(len(self.keys), 1) + entry_ids)
+        grams = pairs // max(len(self.keys), 1)
+        self.postings = (pairs % max(len(self.keys), 1)).astype(np.int32)
+        self.offsets = np.searchsorted(grams, np.arange(BASE ** n + 1))
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _posting(self, low, high, size):
+        """
+        Entries containing a gram that starts with any class combination
+        between low and high (per position) over the first `size` positions.
+        """
+        ranges = [np.arange(lo, hi + 1) for lo, hi in zip(low, high)]
+        combos = np.stack(np.meshgrid(*ranges, indexing="ij"), axis=-1).reshape(-1, size)
+        # A prefix of length size covers BASE ** (n - size) consecutive codes
+        span = BASE ** (self.n - size)
+        first = combos @ (BASE ** np.arange(self.n - 1, self.n - size - 1, -1))
+        lists = [self.postings[self.offsets[code]:self.offsets[code + span]] for code in first.tolist()]
+        return np.unique(np.concatenate(lists))
+
+    def candidates(self, query, tolerance=0):
+        """Returns the sorted ids of entries that may contain the query within the tolerance."""
+        query = np.asarray(query, dtype=np.int64)
+        low, high = quantize(query - tolerance), quantize(query + tolerance)
+        size = min(len(query), self.n)
+        result = None
+        for i in range(max(len(query) - self.n, 0) + 1):
+            # Every class combination this window of the query can round to
+            posting = self._posting(low[i:i + size], high[i:i + size], size)
+            result = posting if result is None else np.intersect1d(result, posting, assume_unique=True)
+            if result.size == 0:
+                break
+        return result.tolist()
+
+    def search(self, query, tolerance=0, limit=None):
+        """
+        Finds every entry with a window where each interval is within
+        `tolerance` semitones of the query. Returns one Match per entry, at
+        the window with the fewest inexact intervals (its distance).
+        Positions count intervals, so interval i leads into contour symbol i + 1.
+        """
+        m = len(query)
+        if m == 0:
+            return []
+        entry_ids = self.candidates(query, tolerance)
+
+        target = np.asarray(query, dtype=np.int16)
+        matches = []
+        for entry_id in entry_ids:
+            intervals = self.intervals[entry_id]
+            if intervals.size < m:
+                continue
+            diff = np.abs(np.lib.stride_tricks.sliding_window_view(intervals, m) - target)
+            within = (diff <= tolerance).all(axis=1)
+            if not within.any():
+                continue
+            misses = np.where(within, (diff != 0).sum(axis=1), m + 1)
+            start = int(misses.argmin())
+            matches.append(Match(self.keys[entry_id], start, start + m, int(misses[start]), int(intervals.size),
+                                 self.voices[entry_id]))
+            if limit is not None and len(matches) >= limit:
+                break
+        return matches
@@ -1,139 +1,542 @@
 
 
-from fastapi import FastAPI, UploadFile
-from database import collection_compositions
+from fastapi import FastAPI, UploadFile, Query, HTTPException
+from fastapi.responses import JSONResponse
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from database import (db, collection_compositions, collection_meta, open_async_client, CATALOG_ID,
+                      packed_entries, interval_entries, rhythm_entries, contour_filter)
+from audio import audio_to_contour
+from suffix_array import SuffixArrayIndex, SUFFIX_ARRAY_FILE, CONTOUR_ENGINE
+from fm_index import FMIndex, FM_INDEX_FILE
+from packed import PackedContours
+from approximate import ContourMatcher, MAX_PATTERN_LENGTH
+from intervals import IntervalIndex, parse_intervals, MAX_TOLERANCE
+from rhythm import RhythmTable, RHYTHM_SYMBOLS
+from ranking import Match, RankedStream
+from cache import TTLCache
 from bson import ObjectId
-import re
-import librosa
-import numpy as np
+from collections import namedtuple
+from pymongo.errors import WaitQueueTimeoutError
+import asyncio
+import base64
+import binascii
+import hashlib
+import multiprocessing
 import os
+import secrets
 import shutil
-import traceback
+import threading
+import time
 
 app = FastAPI()
 
-# --- Helper Functions ---
-def serialize_doc(doc):
-    doc["_id"] = str(doc["_id"])
-    return doc
+# Request handlers await this async client's compositions collection, so a
+# database round trip never blocks the event loop. The synchronous
+# collection_compositions only builds the in-memory indexes at startup.
+mongo_client = None
+compositions = None
 
-def notes_to_contour(notes):
-    """Converts a list of MIDI notes to a Parsons code contour."""
-    if len(notes) < 2:
-        return None
-    contour = ["*"]
-    for i in range(1, len(notes)):
-        if notes[i] > notes[i-1]:
-            contour.append("U")
-        elif notes[i] < notes[i-1]:
-            contour.append("D")
-        else:
-            contour.append("R")
-    return "".join(contour)
+# Composition count for / and /readyz, which load balancers poll constantly.
+# Probes read this cached value; a background task refreshes it every
+# COUNT_REFRESH_INTERVAL seconds from the catalog document ingest records in
+# the meta collection, or from collection metadata (estimated_document_count)
+# when no ingest has recorded one yet. When the catalog's generation changes,
+# the same task reloads the in-memory search indexes.
+COUNT_REFRESH_INTERVAL = float(os.getenv("COUNT_REFRESH_INTERVAL", 60))
+composition_count = None
+count_refreshed_at = None
+count_refresher = None
 
-def audio_to_contour(file_path: str):
-    """Processes an audio file to extract a melodic contour."""
-    try:
-        # Basic sanity checks
-        if not os.path.exists(file_path):
-            raise FileNotFoundError(f"File not found: {file_path}")
+async def refresh_catalog():
+    global composition_count, count_refreshed_at
+    meta = await mongo_client[db.name][collection_meta.name].find_one({"_id": CATALOG_ID})
+    composition_count = meta["count"] if meta else await compositions.estimated_document_count()
+    count_refreshed_at = time.monotonic()
+    generation = meta.get("generation") if meta else None
+    if search_indexes is not None and generation != search_indexes.generation:
+        await reload_search_indexes()
+
+async def keep_catalog_fresh():
+    while True:
         try:
-            file_size = os.path.getsize(file_path)
-        except OSError:
-            file_size = 0
-        if not file_size:
-            raise ValueError("Uploaded file is empty or unreadable")
-
-        # Load the audio file
-        # Use deterministic params; mono to simplify pitch tracking
-        # If resampling fails with native backends, librosa will raise; we catch below
-        y, sr = librosa.load(file_path, sr=22050, mono=True)
-        
-        # Get pitches and magnitudes
-        pitches, magnitudes = librosa.piptrack(y=y, sr=sr)
-        
-        # Select the dominant pitch in each time frame
-        notes = []
-        for t in range(pitches.shape[1]):
-            index = magnitudes[:, t].argmax()
-            pitch = pitches[index, t]
-            if pitch > 0:
-                # Convert frequency to MIDI note number
-                midi_note = librosa.hz_to_midi(pitch)
-                # Add the note if it's different from the last one (simple note segmentation)
-                if not notes or abs(midi_note - notes[-1]) > 0.5:
-                    notes.append(midi_note)
-        
-        # Convert the sequence of notes to a contour
-        return notes_to_contour(notes)
-    except Exception as e:
-        # Print full traceback for visibility in logs
-        print(f"Error processing audio: {e}")
-        traceback.print_exc()
+            await refresh_catalog()
+        except Exception as e:
+            print(f"Could not refresh the catalog: {e}")
+        await asyncio.sleep(COUNT_REFRESH_INTERVAL)
+
+def database_reachable():
+    """Whether the count was refreshed recently, i.e. MongoDB is answering."""
+    return count_refreshed_at is not None and time.monotonic() - count_refreshed_at < 3 * COUNT_REFRESH_INTERVAL
+
+@app.on_event("startup")
+async def on_startup_mongo():
+    global mongo_client, compositions, count_refresher
+    mongo_client = open_async_client()
+    compositions = mongo_client[db.name][collection_compositions.name]
+    count_refresher = asyncio.create_task(keep_catalog_fresh())
+
+@app.on_event("shutdown")
+async def on_shutdown_mongo():
+    count_refresher.cancel()
+    await mongo_client.close()
+
+@app.exception_handler(WaitQueueTimeoutError)
+async def on_mongo_pool_exhausted(request, exc):
+    # Every pooled connection stayed busy for MONGO_WAIT_QUEUE_TIMEOUT_MS
+    return JSONResponse(status_code=503, content={"detail": "Database is busy, please retry shortly"},
+                        headers={"Retry-After": "1"})
+
+# Audio analysis is CPU-bound, so it runs in a pool of worker processes.
+# At most AUDIO_MAX_PENDING jobs may be queued or running; beyond that
+# /search/audio answers 503 instead of piling up work.
+AUDIO_WORKERS = int(os.getenv("AUDIO_WORKERS", os.cpu_count() or 1))
+AUDIO_MAX_PENDING = int(os.getenv("AUDIO_MAX_PENDING", 2 * AUDIO_WORKERS))
+AUDIO_TIMEOUT = float(os.getenv("AUDIO_TIMEOUT", 30))
+
+audio_pool = None
+audio_slots = threading.BoundedSemaphore(AUDIO_MAX_PENDING)
+
+def start_audio_pool():
+    global audio_pool
+    # spawn, not fork: the API process holds MongoDB client threads
+    audio_pool = ProcessPoolExecutor(max_workers=AUDIO_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+
+@app.on_event("startup")
+def on_startup_audio_pool():
+    start_audio_pool()
+
+@app.on_event("shutdown")
+def on_shutdown_audio_pool():
+    audio_pool.shutdown(wait=False, cancel_futures=True)
+
+def restart_audio_pool(broken):
+    """
+    Replaces the pool a request found broken, unless a concurrent request
+    already has, and shuts the broken one down so its workers are reaped.
+    Only called on the event loop, so the check and the swap never interleave.
+    """
+    if audio_pool is broken:
+        broken.shutdown(wait=False, cancel_futures=True)
+        start_audio_pool()
+
+async def run_audio_job(func, *args):
+    """
+    Runs func(*args) in the audio process pool without blocking the event loop.
+    Raises 503 when the pool is saturated and 504 when the job times out.
+    """
+    if not audio_slots.acquire(blocking=False):
+        raise HTTPException(status_code=503, detail="Audio analysis is busy, please retry shortly", headers={"Retry-After": "1"})
+    pool = audio_pool
+    try:
+        future = pool.submit(func, *args)
+    except BrokenProcessPool:
+        audio_slots.release()
+        restart_audio_pool(pool)
+        raise HTTPException(status_code=503, detail="Audio analysis is restarting, please retry shortly", headers={"Retry-After": "1"})
+    # The slot is freed when the job itself finishes, even if the request gave up on it
+    future.add_done_callback(lambda _: audio_slots.release())
+
+    try:
+        return await asyncio.wait_for(asyncio.wrap_future(future), timeout=AUDIO_TIMEOUT)
+    except asyncio.TimeoutError:
+        raise HTTPException(status_code=504, detail="Audio analysis timed out")
+    except BrokenProcessPool:
+        restart_audio_pool(pool)
+        raise HTTPException(status_code=503, detail="Audio analysis is restarting, please retry shortly", headers={"Retry-After": "1"})
+
+# Recent search results. Audio is keyed by a hash of the uploaded bytes, so
+# a re-submitted recording skips decoding and pitch tracking; Parsons by the
+# normalized query. Entries expire after SEARCH_CACHE_TTL seconds.
+SEARCH_CACHE_TTL = float(os.getenv("SEARCH_CACHE_TTL", 600))
+audio_cache = TTLCache(int(os.getenv("AUDIO_CACHE_SIZE", 256)), SEARCH_CACHE_TTL)
+parsons_cache = TTLCache(int(os.getenv("PARSONS_CACHE_SIZE", 1024)), SEARCH_CACHE_TTL)
+
+# Ranked result streams behind the next_cursor of each search response. A
+# cursor names a stream and an offset into it, so /search/more pops the next
+# page off the stream instead of searching and scoring again. A search keeps
+# its stream in a continuation, (stream id, stream, finish, next offset),
+# which the result caches hold instead of a cursor: every response built
+# from one re-registers the stream, so a cached first page never hands out
+# a cursor whose stream was already evicted.
+MAX_PAGE_SIZE = 100
+search_streams = TTLCache(int(os.getenv("SEARCH_STREAM_CACHE_SIZE", 256)), SEARCH_CACHE_TTL)
+
+def encode_cursor(stream_id, offset):
+    return base64.urlsafe_b64encode(f"{stream_id}:{offset}".encode()).decode()
+
+def decode_cursor(cursor):
+    """Returns the (stream id, offset) of a cursor. Raises 400 if it is malformed."""
+    try:
+        stream_id, offset = base64.urlsafe_b64decode(cursor.encode()).decode().rsplit(":", 1)
+        offset = int(offset)
+    except (ValueError, UnicodeError, binascii.Error):
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    if offset < 0:
+        raise HTTPException(status_code=400, detail="Malformed cursor")
+    return stream_id, offset
+
+async def page_results(stream, finish, limit, offset=0):
+    """
+    Takes `limit` results of a RankedStream from offset on and turns them
+    into response documents with await finish([(score, match), ...]).
+    Returns (results, offset of the next page or None after the last).
+    """
+    ranked = stream.page(offset, limit)
+    next_offset = offset + len(ranked)
+    return await finish(ranked), (next_offset if next_offset < len(stream) else None)
+
+async def first_page(stream, finish, limit):
+    """First page of a new search: (results, candidates examined, continuation or None)."""
+    results, next_offset = await page_results(stream, finish, limit)
+    continuation = None if next_offset is None else (secrets.token_urlsafe(12), stream, finish, next_offset)
+    return results, stream.examined, continuation
+
+def continuation_cursor(continuation):
+    """(Re)stores the stream of a continuation and returns its cursor, or None without one."""
+    if continuation is None:
         return None
+    stream_id, stream, finish, offset = continuation
+    search_streams.put(stream_id, (stream, finish))
+    return encode_cursor(stream_id, offset)
+
+# The in-memory search structures of one catalog generation:
+# - packed: every voice contour, packed 2 bits per step as stored in MongoDB
+# - contours: the substring engine (see CONTOUR_ENGINE), by default the
+#   FM-index ingest.py writes, whose query time grows with the number of
+#   matches rather than the corpus; the packed scan without a current file
+# - matcher: bit-parallel matcher for searches that allow edit errors
+# - intervals: n-gram index over quantized semitone intervals
+# - rhythms: rhythm strings of every voice, checked against query rhythms
+# A request keeps the snapshot it started with, so a reload that swaps in
+# the next generation never mixes the two.
+SearchIndexes = namedtuple("SearchIndexes", ["generation", "packed", "contours", "matcher", "intervals", "rhythms"])
+search_indexes = None
+
+def same_contours(index, packed):
+    """Whether an on-disk index holds the same voices, with the same contour lengths, as the packed contours."""
+    if len(index) != len(packed):
+        return False
+    lengths = dict(zip(zip(packed.keys, packed.voices), packed.lengths.tolist()))
+    return all(lengths.get(entry) == length
+               for entry, length in zip(zip(index.keys, index.voices), index.lengths.tolist()))
+
+def open_contour_engine(packed):
+    """
+    The on-disk index CONTOUR_ENGINE names, or None to scan the packed
+    contours when there is no such file or it no longer matches them.
+    """
+    index = None
+    try:
+        if CONTOUR_ENGINE == "fm-index" and os.path.exists(FM_INDEX_FILE):
+            # Opened with mmap, so uvicorn workers share one page-cached copy
+            index = FMIndex(FM_INDEX_FILE)
+        elif CONTOUR_ENGINE == "suffix-array" and os.path.exists(SUFFIX_ARRAY_FILE):
+            index = SuffixArrayIndex.load(SUFFIX_ARRAY_FILE)
+    except ValueError as e:
+        # Written by an older ingest; rerun it to rebuild
+        print(f"Skipping contour index ({CONTOUR_ENGINE}): {e}")
+
+    if index is not None and not same_contours(index, packed):
+        print(f"Contour index ({CONTOUR_ENGINE}) is out of date; rerun ingest to rebuild it")
+        index = None
+    if index is not None:
+        print(f"Opened contour index ({CONTOUR_ENGINE}) over {len(index)} voice contours")
+    elif CONTOUR_ENGINE != "packed":
+        print(f"No current contour index ({CONTOUR_ENGINE}); scanning packed contours instead")
+    return index
+
+def load_search_indexes():
+    """Builds every search structure from the live collection. Blocks."""
+    # Read the generation first: if ingest finishes mid-build, the next
+    # refresh sees a newer one and loads again
+    meta = collection_meta.find_one({"_id": CATALOG_ID})
+    generation = meta.get("generation") if meta else None
+
+    entries = list(packed_entries(collection_compositions))
+    packed = PackedContours(entries)
+    print(f"Loaded {len(packed)} packed voice contours ({packed.nbytes} bytes)")
+    intervals = IntervalIndex(interval_entries(collection_compositions))
+    print(f"Indexed {len(intervals)} interval sequences")
+    rhythms = RhythmTable(rhythm_entries(collection_compositions))
+    print(f"Loaded {len(rhythms)} rhythm strings")
+    return SearchIndexes(generation, packed, open_contour_engine(packed) or packed, ContourMatcher(entries), intervals, rhythms)
+
+@app.on_event("startup")
+def on_startup_search_indexes():
+    global search_indexes
+    search_indexes = load_search_indexes()
+
+async def reload_search_indexes():
+    """Swaps in indexes built from the new catalog generation, off the event loop."""
+    global search_indexes
+    print("Catalog generation changed; reloading search indexes")
+    search_indexes = await asyncio.to_thread(load_search_indexes)
+    # Cached results and cursors point into the previous generation
+    audio_cache.clear()
+    parsons_cache.clear()
+    search_streams.clear()
 
+# --- Helper Functions ---
+# Symbols of context kept on each side of a hit in the match snippet
+SNIPPET_CONTEXT = 8
+
+async def fetch_by_path(paths):
+    """
+    Fetches slim result documents by lilypond_path, keeping the order of
+    paths: id, title, composer and path, plus the voice track metadata
+    fetch_ranked attaches to voice matches. Contours come from memory.
+    """
+    projection = {"title": 1, "composer": 1, "lilypond_path": 1,
+                  "voices.track": 1, "voices.channel": 1, "voices.name": 1}
+    cursor = compositions.find({"lilypond_path": {"$in": paths}}, projection)
+    docs = {doc["lilypond_path"]: doc async for doc in cursor}
+    results = []
+    for path in paths:
+        if path in docs:
+            doc = docs[path]
+            doc["_id"] = str(doc["_id"])
+            results.append(doc)
+    return results
+
+async def find_by_contour(query, limit, max_errors=0, rhythm=None, include_contour=False):
+    """
+    Looks up compositions with a voice whose contour contains the query,
+    using the in-memory index, ranks each composition by its best voice and
+    fetches the best `limit` from MongoDB. With max_errors > 0, windows
+    within that many edits also match. With a rhythm string (aligned with
+    the query), matches whose rhythm disagrees are dropped before scoring
+    and the rest are ranked on rhythm too. Results carry the matched
+    contours only with include_contour.
+    Returns (results, number of candidates examined, continuation).
+    """
+    indexes = search_indexes
+    if max_errors:
+        query = query[:MAX_PATTERN_LENGTH]
+
+    def rank():
+        if not max_errors:
+            matches = indexes.contours.search(query)
+        else:
+            matches = indexes.matcher.search(query, max_errors)
+        if rhythm:
+            matches = indexes.rhythms.filter(matches, rhythm[:len(query)])
+        return RankedStream(matches, len(query))
+
+    # A scan of every contour takes long enough to stall other requests
+    stream = await asyncio.to_thread(rank)
+
+    async def finish(ranked):
+        if max_errors:
+            # Only the results on a page pay for an exact window alignment
+            ranked = [(score, indexes.matcher.align(match, query, max_errors)) for score, match in ranked]
+        return await fetch_ranked(ranked, indexes.packed, include_contour)
+
+    return await first_page(stream, finish, limit)
+
+async def find_by_contour_lookup(contour, mode, limit, rhythm=None, include_contour=False):
+    """
+    Prefix or exact contour search answered by MongoDB from the
+    melodic_contour and voices.contour indexes (see contour_filter). The
+    contour must be uppercase and start with '*'. Only the paths of the
+    matching documents are read; which of their voices match comes from the
+    packed contours, and each is ranked like an index hit.
+    Returns (results, number of candidates examined, continuation).
+    """
+    indexes = search_indexes
+    cursor = compositions.find(contour_filter(contour, mode), {"_id": 0, "lilypond_path": 1})
+    paths = {doc["lilypond_path"] async for doc in cursor}
+
+    def rank():
+        packed = indexes.packed
+        matches = []
+        # An anchored query only compares each contour's first symbols
+        for entry_id, _ in packed.locate(contour):
+            key, length = packed.keys[entry_id], int(packed.lengths[entry_id])
+            if key in paths and (mode == "prefix" or length == len(contour)):
+                matches.append(Match(key, 0, len(contour), 0, length, packed.voices[entry_id]))
+        if rhythm:
+            matches = indexes.rhythms.filter(matches, rhythm)
+        return RankedStream(matches, len(contour))
+
+    stream = await asyncio.to_thread(rank)
+    finish = lambda ranked: fetch_ranked(ranked, indexes.packed, include_contour)
+    return await first_page(stream, finish, limit)
+
+async def find_by_intervals(intervals, limit, tolerance=0, include_contour=False):
+    """
+    Looks up compositions with a voice containing the semitone interval
+    sequence, each step within `tolerance` semitones, using the interval
+    n-gram index. Returns (results, number of candidates examined, continuation).
+    """
+    indexes = search_indexes
+    # Short or tolerant queries check thousands of candidates, so off the event loop
+    stream = await asyncio.to_thread(lambda: RankedStream(indexes.intervals.search(intervals, tolerance), len(intervals)))
+    finish = lambda ranked: fetch_ranked(ranked, indexes.packed, include_contour, contour_offset=1)
+    return await first_page(stream, finish, limit)
+
+async def fetch_ranked(ranked, packed, include_contour=False, contour_offset=0):
+    """
+    Fetches the compositions of [(score, match), ...] and attaches each
+    score and match, with a snippet around the hit cut from the packed
+    contours of the same index generation. contour_offset shifts match
+    positions onto the contour (interval i leads into contour symbol i + 1).
+    A match whose voice the fetched document or the packed contours no
+    longer have (it changed after the index was built) is dropped.
+    """
+    results = []
+    scored = {match.key: (score, match) for score, match in ranked}
+    for doc in await fetch_by_path([match.key for _, match in ranked]):
+        score, match = scored[doc["lilypond_path"]]
+        voices = doc.pop("voices", None) or []
+        entry_id = packed.ids.get((match.key, match.voice))
+        if entry_id is None or (match.voice is not None and match.voice >= len(voices)):
+            continue
+        results.append(doc)
+        start, end = match.start + contour_offset, match.end + contour_offset
+        snippet_start = max(0, start - SNIPPET_CONTEXT)
+
+        doc["score"] = round(score, 4)
+        doc["match"] = {
+            "start": match.start,
+            "end": match.end,
+            "distance": match.distance,
+            "rhythm": match.rhythm,
+            # voice indexes the composition's voices; None means the main melody
+            "voice": match.voice,
+            "snippet": packed.contour(entry_id, snippet_start, end + SNIPPET_CONTEXT),
+            "snippet_start": snippet_start,
+        }
+        if match.voice is not None:
+            voice = voices[match.voice]
+            doc["match"].update(track=voice.get("track"), channel=voice.get("channel"), name=voice.get("name"))
+            if include_contour:
+                doc["match"]["contour"] = packed.contour(entry_id)
+        if include_contour:
+            melody_id = packed.ids.get((match.key, None))
+            doc["melodic_contour"] = packed.contour(melody_id) if melody_id is not None else None
+    return results
 
 @app.get("/")
 async def root():
-    count = collection_compositions.count_documents({})
     return {
         "message": "Music Search Engine is running!",
-        "database_connection": "successful",
-        "composition_count": count
+        "database_connection": "successful" if database_reachable() else "unavailable",
+        "composition_count": composition_count
     }
 
+@app.get("/healthz")
+async def healthz():
+    # Liveness: the process is serving requests; touches nothing else
+    return {"status": "ok"}
+
+@app.get("/readyz")
+async def readyz():
+    # Readiness: the search indexes are loaded and MongoDB answered recently
+    problems = [] if search_indexes is not None else ["search indexes"]
+    if not database_reachable():
+        problems.append("database")
+    if problems:
+        return JSONResponse(status_code=503, content={"status": "not ready", "waiting_for": problems})
+    return {"status": "ready", "composition_count": composition_count}
+
 @app.post("/search/parsons")
-async def search_by_parsons(query: str):
-    print(f"Received Parsons query: {query}")
-    
-    # 2. Escape any special regex characters in the user's input
-    escaped_query = re.escape(query)
-    
-    # 3. Find documents where the contour STARTS WITH the user's query
-    #    This is more flexible and handles the '*' correctly.
-    results_cursor = collection_compositions.find(
-        {"melodic_contour": {"$regex": f"{escaped_query}", "$options": "i"}}
-    ).limit(20)
-    
-    results_list = [serialize_doc(doc) for doc in results_cursor]
+async def search_by_parsons(query: str, max_errors: int = Query(0, ge=0), rhythm: str | None = None,
+                            mode: str = Query("substring", pattern="^(substring|prefix|exact)$"),
+                            include_contour: bool = False, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    print(f"Received Parsons query: {query} ({mode})")
+    contour = query.strip().upper()
+
+    # Optional rhythm, one symbol per query symbol: S(horter), E(qual) or
+    # L(onger) than the previous inter-onset interval, '*' where unknown
+    if rhythm is not None:
+        rhythm = rhythm.strip().upper()
+        if len(rhythm) != len(contour) or not set(rhythm) <= RHYTHM_SYMBOLS:
+            raise HTTPException(status_code=400, detail="rhythm must give one of *, S, E, L per query symbol")
+    if mode != "substring" and max_errors:
+        raise HTTPException(status_code=400, detail=f"max_errors needs substring mode, not {mode}")
+
+    # substring: contours containing the query; a leading '*' only matches
+    # at the start of a contour. prefix / exact: contours starting with /
+    # equal to the query, whose leading '*' is implied.
+    if mode != "substring" and not contour.startswith("*"):
+        contour = "*" + contour
+        rhythm = rhythm and "*" + rhythm
+    cache_key = (contour, mode, max_errors, rhythm, include_contour, limit)
+    cached = parsons_cache.get(cache_key)
+    if cached is None:
+        if mode == "substring":
+            cached = await find_by_contour(contour, limit=limit, max_errors=max_errors, rhythm=rhythm,
+                                           include_contour=include_contour)
+        else:
+            cached = await find_by_contour_lookup(contour, mode, limit=limit, rhythm=rhythm, include_contour=include_contour)
+        parsons_cache.put(cache_key, cached)
+    results_list, examined, continuation = cached
     
-    return {"query": query, "results": results_list}
+    return {"query": query, "candidates_examined": examined, "results": results_list,
+            "next_cursor": continuation_cursor(continuation)}
+
+@app.post("/search/intervals")
+async def search_by_intervals(query: str, tolerance: int = Query(0, ge=0, le=MAX_TOLERANCE),
+                              include_contour: bool = False, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    print(f"Received interval query: {query}")
+
+    # Semitone steps between consecutive notes, e.g. "2,2,-4" or "+2 +2 -4";
+    # matching is transposition-invariant since only the steps are compared
+    intervals = parse_intervals(query)
+    if not intervals:
+        raise HTTPException(status_code=400, detail="Query must list semitone intervals, e.g. 2,2,-4")
+
+    results_list, examined, continuation = await find_by_intervals(intervals, limit=limit, tolerance=tolerance,
+                                                                   include_contour=include_contour)
+
+    return {"query": intervals, "candidates_examined": examined, "results": results_list,
+            "next_cursor": continuation_cursor(continuation)}
 
 @app.post("/search/audio")
-async def search_by_audio(file: UploadFile):
-    # Save the uploaded audio file temporarily
-    temp_dir = "temp_audio"
-    os.makedirs(temp_dir, exist_ok=True)
-    file_path = os.path.join(temp_dir, file.filename)
-    
-    try:
-        # --- MODIFIED FILE SAVING LOGIC ---
-        # Read the file's contents into memory
-        contents = await file.read()
-        
-        # Write the contents to a temporary file
-        with open(file_path, "wb") as buffer:
-            buffer.write(contents)
-        # --- END OF MODIFICATION ---
-
-        # Process the audio file to get a contour
-        contour = audio_to_contour(file_path)
-    
-    finally:
-        # Ensure the temporary file is always cleaned up
-        if os.path.exists(file_path):
-            os.remove(file_path)
+async def search_by_audio(file: UploadFile, max_errors: int = Query(0, ge=0), include_contour: bool = False,
+                          limit: int = Query(10, ge=1, le=MAX_PAGE_SIZE)):
+    # Decode straight from the uploaded bytes; no per-request file on disk
+    contents = await file.read()
+
+    # A retried upload of the same recording reuses the earlier answer
+    cache_key = (hashlib.sha256(contents).hexdigest(), max_errors, include_contour, limit)
+    cached = audio_cache.get(cache_key)
+    if cached is not None:
+        response, continuation = cached
+        return {**response, "next_cursor": continuation_cursor(continuation)}
 
-    print(f"Generated Contour from Audio: {contour}")
+    # Process the audio to get a contour, off the event loop
+    contour, rhythm = await run_audio_job(audio_to_contour, contents, file.filename)
+
+    print(f"Generated Contour from Audio: {contour} (rhythm {rhythm})")
 
     if not contour:
-        return {"generated_contour": None, "results": []}
+        response = {"generated_contour": None, "generated_rhythm": None, "candidates_examined": 0, "results": []}
+        continuation = None
+    else:
+        # Search the index with the generated contour, checking its rhythm
+        results_list, examined, continuation = await find_by_contour(contour, limit=limit, max_errors=max_errors,
+                                                                     rhythm=rhythm, include_contour=include_contour)
+        response = {"generated_contour": contour, "generated_rhythm": rhythm, "candidates_examined": examined,
+                    "results": results_list}
 
-    # Search the database with the generated contour
-    results_cursor = collection_compositions.find(
-        {"melodic_contour": {"$regex": re.escape(contour), "$options": "i"}}
-    ).limit(10)
-    
-    results_list = [serialize_doc(doc) for doc in results_cursor]
-    
-    return {"generated_contour": contour, "results": results_list}
\ No newline at end of file
+    audio_cache.put(cache_key, (response, continuation))
+    return {**response, "next_cursor": continuation_cursor(continuation)}
+
+@app.get("/search/more")
+async def search_more(cursor: str, limit: int = Query(20, ge=1, le=MAX_PAGE_SIZE)):
+    # Resumes the ranked stream of an earlier /search/* call at its next_cursor
+    stream_id, offset = decode_cursor(cursor)
+    stored = search_streams.get(stream_id)
+    if stored is None:
+        raise HTTPException(status_code=410, detail="Cursor has expired, please run the search again")
+    stream, finish = stored
+    results_list, next_offset = await page_results(stream, finish, limit, offset)
+    continuation = None if next_offset is None else (stream_id, stream, finish, next_offset)
+
+    return {"results": results_list, "next_cursor": continuation_cursor(continuation)}
+
+@app.get("/cache/stats")
+async def cache_stats():
+    return {"audio": audio_cache.stats(), "parsons": parsons_cache.stats(), "streams": search_streams.stats()}
\ No newline at end of file
@@ -0,0 +1,67 @@
+# manifest.py
+import hashlib
+import json
+import os
+
+MANIFEST_FILE = "ingest_manifest.json"
+MANIFEST_VERSION = 3
+
+
+def load_manifest(path=MANIFEST_FILE, settings=None):
+    """
+    Returns {dirpath: entry} from the last ingest run, or {} if there is none
+    or it was made with different settings (which change every document).
+    Each entry records the fingerprint of the pair's .ly and .mid files and
+    the lilypond_path it was stored under (None if the pair was skipped).
+    """
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    if data.get("version") != MANIFEST_VERSION or data.get("settings") != settings:
+        return {}
+    return data.get("pairs", {})
+
+
+def save_manifest(pairs, path=MANIFEST_FILE, settings=None):
+    """Writes the manifest atomically, so an interrupted run keeps the old one."""
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"version": MANIFEST_VERSION, "settings": settings, "pairs": pairs}, f, indent=1, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 16), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def fingerprint(ly_path, mid_path, previous=None):
+    """
+    Returns {file: {"path", "mtime", "size", "sha256"}} for a pair. Files
+    whose path, mtime and size match the previous fingerprint reuse its hash
+    instead of being read again.
+    """
+    result = {}
+    for name, path in (("ly", ly_path), ("mid", mid_path)):
+        stat = os.stat(path)
+        old = (previous or {}).get(name, {})
+        if old.get("path") == path and old.get("mtime") == stat.st_mtime_ns and old.get("size") == stat.st_size:
+            sha256 = old["sha256"]
+        else:
+            sha256 = file_hash(path)
+        result[name] = {"path": path, "mtime": stat.st_mtime_ns, "size": stat.st_size, "sha256": sha256}
+    return result
+
+
+def same_files(a, b):
+    """True if two fingerprints describe the same file contents."""
+    return all(
+        a.get(name, {}).get("path") == b.get(name, {}).get("path")
+        and a.get(name, {}).get("sha256") == b.get(name, {}).get("sha256")
+        for name in ("ly", "mid")
+    )
@@ -0,0 +1,85 @@
+# melody.py
+import numpy as np
+
+# General MIDI reserves channel 10 (9 counting from zero) for percussion
+PERCUSSION_CHANNEL = 9
+# Voices shorter than this are too short to hold a searchable theme
+MIN_VOICE_NOTES = 8
+
+
+# Every extractor returns (pitches, onset ticks) as two equal-length lists
+
+
+def busiest_track(tracks):
+    """The notes of the track with the most note_on events."""
+    track = max(tracks, key=lambda t: t.note_on_count)
+    return list(track.notes), list(track.ticks)
+
+
+def _skyline(notes, ticks):
+    """Keeps the highest pitch at each onset, in time order."""
+    if notes.size == 0:
+        return [], []
+    order = np.lexsort((-notes, ticks))
+    notes, ticks = notes[order], ticks[order]
+    first = np.ones(ticks.size, dtype=bool)
+    first[1:] = ticks[1:] != ticks[:-1]
+    return notes[first].tolist(), ticks[first].tolist()
+
+
+def _pitched_notes(tracks):
+    """All sounding notes of every track, without percussion, as arrays."""
+    notes = np.concatenate([np.asarray(t.notes, dtype=np.int16) for t in tracks])
+    ticks = np.concatenate([np.asarray(t.ticks, dtype=np.int64) for t in tracks])
+    channels = np.concatenate([np.asarray(t.channels, dtype=np.uint8) for t in tracks])
+    pitched = channels != PERCUSSION_CHANNEL
+    return notes[pitched], ticks[pitched], channels[pitched]
+
+
+def skyline(tracks):
+    """The highest sounding note at every onset across all tracks."""
+    notes, ticks, _ = _pitched_notes(tracks)
+    return _skyline(notes, ticks)
+
+
+def channel_skyline(tracks):
+    """
+    The skyline of the busiest channel. Unlike busiest_track, this separates
+    the voices of type-0 files, where every channel shares one track.
+    """
+    notes, ticks, channels = _pitched_notes(tracks)
+    if notes.size == 0:
+        return [], []
+    busiest = np.bincount(channels, minlength=16).argmax()
+    selected = channels == busiest
+    return _skyline(notes[selected], ticks[selected])
+
+
+def split_voices(tracks, min_notes=MIN_VOICE_NOTES):
+    """
+    Splits a file into voices, one per channel within each track, so inner
+    parts and other instruments can be searched too. Chords inside a voice
+    are reduced to their top note. Voices with fewer than min_notes onsets
+    are dropped. Returns [(track index, channel, track name, pitches, onsets)].
+    """
+    result = []
+    for index, track in enumerate(tracks):
+        notes = np.asarray(track.notes, dtype=np.int16)
+        ticks = np.asarray(track.ticks, dtype=np.int64)
+        channels = np.asarray(track.channels, dtype=np.uint8)
+        for channel in np.unique(channels).tolist():
+            if channel == PERCUSSION_CHANNEL:
+                continue
+            selected = channels == channel
+            pitches, onsets = _skyline(notes[selected], ticks[selected])
+            if len(pitches) >= min_notes:
+                result.append((index, channel, track.name, pitches, onsets))
+    return result
+
+
+MELODY_EXTRACTORS = {
+    "busiest-track": busiest_track,
+    "skyline": skyline,
+    "channel": channel_skyline,
+}
+DEFAULT_MELODY = "busiest-track"
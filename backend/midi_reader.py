@@ -0,0 +1,131 @@
+# midi_reader.py
+from array import array
+from collections import namedtuple
+import mido
+
+# note_on_count counts every note_on event (including velocity 0, as mido
+# does); notes, ticks and channels describe the sounding ones (velocity > 0):
+# pitch, absolute onset in ticks and MIDI channel. name is the first
+# track_name meta event, or None
+TrackNotes = namedtuple("TrackNotes", ["note_on_count", "notes", "ticks", "channels", "name"])
+
+TRACK_NAME = 0x03
+
+# Data bytes that follow each channel message status (high nibble)
+DATA_LENGTHS = {0x80: 2, 0x90: 2, 0xA0: 2, 0xB0: 2, 0xC0: 1, 0xD0: 1, 0xE0: 2}
+
+
+def _read_varlen(data, pos, end):
+    value = 0
+    while True:
+        if pos >= end:
+            raise ValueError("truncated variable-length quantity")
+        byte = data[pos]
+        pos += 1
+        value = (value << 7) | (byte & 0x7F)
+        if byte < 0x80:
+            return value, pos
+
+
+def _read_track(data, pos, end):
+    """Scans one MTrk chunk, keeping only note_on events."""
+    note_on_count = 0
+    notes, ticks, channels = array("B"), array("L"), array("B")
+    status = None
+    tick = 0
+    name = None
+    while pos < end:
+        delta, pos = _read_varlen(data, pos, end)
+        tick += delta
+        if pos >= end:
+            raise ValueError("truncated event")
+        byte = data[pos]
+        if byte >= 0x80:
+            pos += 1
+            if byte != 0xFF:
+                # Meta events don't set running status
+                status = byte
+        elif status is None:
+            raise ValueError("running status without a previous status")
+        else:
+            byte = status
+
+        if byte == 0xFF:
+            if pos >= end:
+                raise ValueError("truncated meta event")
+            meta_type = data[pos]
+            length, pos = _read_varlen(data, pos + 1, end)
+            if meta_type == TRACK_NAME and name is None:
+                name = data[pos:pos + length].decode("latin-1")
+            pos += length
+        elif byte in (0xF0, 0xF7):
+            length, pos = _read_varlen(data, pos, end)
+            pos += length
+        else:
+            kind = byte & 0xF0
+            size = DATA_LENGTHS.get(kind)
+            if size is None:
+                raise ValueError(f"undefined status byte 0x{byte:02x}")
+            if pos + size > end:
+                raise ValueError("truncated channel message")
+            if kind == 0x90:
+                note_on_count += 1
+                if data[pos + 1]:
+                    notes.append(data[pos])
+                    ticks.append(tick)
+                    channels.append(byte & 0x0F)
+            pos += size
+    if pos != end:
+        raise ValueError("event runs past the end of its track")
+    return TrackNotes(note_on_count, notes, ticks, channels, name)
+
+
+def read_midi_notes(midi_path):
+    """
+    Reads a Standard MIDI File straight from its chunks in a single pass,
+    skipping every event other than note_on without building message objects.
+    Returns one TrackNotes per track. Raises ValueError on malformed files.
+    """
+    with open(midi_path, "rb") as f:
+        data = f.read()
+
+    if data[:4] != b"MThd" or len(data) < 14:
+        raise ValueError("missing MThd header")
+    header_length = int.from_bytes(data[4:8], "big")
+    n_tracks = int.from_bytes(data[10:12], "big")
+
+    tracks = []
+    pos = 8 + header_length
+    for _ in range(n_tracks):
+        if data[pos:pos + 4] != b"MTrk":
+            raise ValueError("missing MTrk header")
+        length = int.from_bytes(data[pos + 4:pos + 8], "big")
+        start = pos + 8
+        end = start + length
+        if end > len(data):
+            raise ValueError("track runs past the end of the file")
+        tracks.append(_read_track(data, start, end))
+        pos = end
+    return tracks
+
+
+def read_midi_notes_mido(midi_path):
+    """Same result as read_midi_notes via mido, for files it rejects."""
+    tracks = []
+    for track in mido.MidiFile(midi_path).tracks:
+        note_on_count = 0
+        notes, ticks, channels = array("B"), array("L"), array("B")
+        tick = 0
+        name = None
+        for msg in track:
+            tick += msg.time
+            if msg.type == 'track_name' and name is None:
+                name = msg.name
+            elif msg.type == 'note_on':
+                note_on_count += 1
+                if msg.velocity > 0:
+                    notes.append(msg.note)
+                    ticks.append(tick)
+                    channels.append(msg.channel)
+        tracks.append(TrackNotes(note_on_count, notes, ticks, channels, name))
+    return tracks
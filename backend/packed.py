@@ -0,0 +1,151 @@
+# packed.py
+import numpy as np
+from corpus import entry_offsets, ContourSearch
+
+# Each step of a contour takes 2 bits, four steps per byte, lowest bits
+# first. Code 0 is padding; the leading '*' is not stored, since every
+# contour has exactly one. In a PackedContours buffer the padding byte in
+# front of each contour stands in for its '*', so code 0 doubles as '*'.
+SYMBOLS = "*UDR"
+CODES = {symbol: code for code, symbol in enumerate(SYMBOLS)}
+STEPS_PER_BYTE = 4
+STEPS_PER_WORD = 32
+
+_LUT = np.zeros(256, dtype=np.uint8)
+for _symbol in "UDR":
+    _LUT[ord(_symbol)] = CODES[_symbol]
+_SHIFTS = np.arange(0, 8, 2, dtype=np.uint8)
+
+
+def pack_contour(contour):
+    """Packs the U/D/R steps after a contour's leading '*' into bytes."""
+    steps = contour.upper().lstrip("*").encode("ascii")
+    codes = _LUT[np.frombuffer(steps, dtype=np.uint8)]
+    codes = np.concatenate((codes, np.zeros(-codes.size % STEPS_PER_BYTE, dtype=np.uint8)))
+    return (codes.reshape(-1, STEPS_PER_BYTE) << _SHIFTS).sum(axis=1, dtype=np.uint8).tobytes()
+
+
+def unpack_codes(packed):
+    """Step codes of a packed contour, without padding."""
+    codes = ((np.frombuffer(packed, dtype=np.uint8)[:, None] >> _SHIFTS) & 3).ravel()
+    nonzero = np.flatnonzero(codes)
+    return codes[:nonzero[-1] + 1] if nonzero.size else codes[:0]
+
+
+def unpack_contour(packed):
+    """The contour string of a packed contour, '*' included."""
+    return "*" + "".join(SYMBOLS[code] for code in unpack_codes(packed).tolist())
+
+
+def encode_query(query):
+    """
+    Codes of a query, with '*' allowed only at the start. Returns None if
+    it holds anything else, since it can then never match.
+    """
+    query = query.upper()
+    if not query or any(symbol not in "UDR" for symbol in query[1:]) or query[0] not in SYMBOLS:
+        return None
+    return [CODES[symbol] for symbol in query]
+
+
+class PackedContours(ContourSearch):
+    """
+    Every contour packed into one buffer of 64-bit words, each preceded by
+    a zero padding byte, at a quarter of a byte per symbol. A query of up to
+    32 symbols is compared against a whole window per word operation: the
+    scan tests every offset within a word across the entire buffer at once,
+    and longer queries check their remaining 32-symbol chunks on the hits.
+    """
+
+    def __init__(self, entries):
+        self.keys, self.voices, parts = [], [], []
+        for key, voice, packed in entries:
+            self.keys.append(key)
+            self.voices.append(voice)
+            parts.append(bytes(packed))
+
+        sizes = np.array([len(part) + 1 for part in parts], dtype=np.int64)
+        byte_starts = np.cumsum(sizes) - sizes + 1
+        buffer = b"".join(b"\x00" + part for part in parts)
+        # Pad to whole words, plus one spare word so windows never read past the end
+        buffer += b"\x00" * (-len(buffer) % 8 + 8)
+        self.words = np.frombuffer(buffer, dtype="<u8")
+        # Position of each contour's '*', in symbols from the start of the buffer
+        self.starts = byte_starts * STEPS_PER_BYTE - 1
+        self.lengths = np.array([unpack_codes(part).size + 1 for part in parts], dtype=np.int64)
+        self.ids = {(key, voice): entry_id for entry_id, (key, voice) in enumerate(zip(self.keys, self.voices))}
+
+    def __len__(self):
+        return len(self.keys)
+
+    @property
+    def nbytes(self):
+        return self.words.nbytes
+
+    def codes_at(self, positions):
+        """The 2-bit codes at the given symbol positions."""
+        positions = np.asarray(positions, dtype=np.int64)
+        shifts = (2 * (positions % STEPS_PER_WORD)).astype(np.uint64)
+        return ((self.words[positions // STEPS_PER_WORD] >> shifts) & np.uint64(3)).astype(np.uint8)
+
+    def contour(self, entry_id, begin=0, end=None):
+        """The contour string of one entry, or its [begin, end) slice."""
+        length = int(self.lengths[entry_id])
+        begin, end = max(0, min(begin, length)), length if end is None else max(0, min(end, length))
+        start = int(self.starts[entry_id])
+        return "".join(SYMBOLS[code] for code in self.codes_at(np.arange(start + begin, start + max(begin, end))).tolist())
+
+    def windows(self, positions, size=STEPS_PER_WORD):
+        """The `size` (<= 32) symbols starting at each position, as one word each."""
+        index = positions // STEPS_PER_WORD
+        shift = (2 * (positions % STEPS_PER_WORD)).astype(np.uint64)
+        low = self.words[index] >> shift
+        # Shifting a uint64 by 64 is undefined, so aligned windows take no high part
+        high = np.where(shift > 0, self.words[np.minimum(index + 1, self.words.size - 1)] << (np.uint64(64) - shift), 0)
+        return (low | high) & _mask(size)
+
+    def _scan(self, pattern):
+        """Every buffer position where the first (<= 32) symbols of the pattern start."""
+        size = min(len(pattern), STEPS_PER_WORD)
+        target, mask = _pattern_word(pattern[:size]), _mask(size)
+        words, following = self.words[:-1], self.words[1:]
+        hits = []
+        for offset in range(STEPS_PER_WORD):
+            if offset:
+                shift = np.uint64(2 * offset)
+                windows = (words >> shift) | (following << (np.uint64(64) - shift))
+            else:
+                windows = words
+            found = np.flatnonzero((windows & mask) == target)
+            if found.size:
+                hits.append(found * STEPS_PER_WORD + offset)
+        return np.sort(np.concatenate(hits)) if hits else np.zeros(0, dtype=np.int64)
+
+    def locate(self, query):
+        """Sorted (entry id, offset) pairs for every occurrence of the query."""
+        pattern = encode_query(query)
+        if pattern is None:
+            return []
+        if pattern[0] == CODES["*"]:
+            # Anchored: only the '*' of each contour can start a match
+            positions = self.starts[self.lengths >= len(pattern)]
+            positions = positions[self.windows(positions, min(len(pattern), STEPS_PER_WORD))
+                                  == _pattern_word(pattern[:STEPS_PER_WORD])]
+        else:
+            positions = self._scan(pattern)
+
+        # Check the rest of a long pattern 32 symbols at a time
+        for chunk in range(STEPS_PER_WORD, len(pattern), STEPS_PER_WORD):
+            part = pattern[chunk:chunk + STEPS_PER_WORD]
+            positions = positions[self.windows(positions + chunk, len(part)) == _pattern_word(part)]
+
+        # Padding never matches a step, so a hit cannot cross into the next contour
+        return entry_offsets(self.starts, positions)
+
+
+def _mask(size):
+    return np.uint64((1 << (2 * size)) - 1)
+
+
+def _pattern_word(codes):
+    return np.uint64(sum(code << (2 * i) for i, code in enumerate(codes)))
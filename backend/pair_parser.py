@@ -0,0 +1,258 @@
+# pair_parser.py
+"""
+Parses one Mutopia .ly/.mid pair into a composition document. Ingest runs
+this in spawned worker processes, so nothing here may import the database
+module or open a connection.
+"""
+import os
+import re
+from bson import Binary
+from midi_reader import read_midi_notes, read_midi_notes_mido
+from melody import MELODY_EXTRACTORS, DEFAULT_MELODY, split_voices
+from intervals import notes_to_intervals
+from rhythm import onsets_to_rhythm
+from packed import pack_contour
+from contour import notes_to_contour
+
+SOURCE_DIR = "mutopia_files"
+
+COMPOSERS = {
+    "Johann Sebastian Bach",
+    "Béla Bartók",
+    "Johannes Brahms",
+    "Max Bruch",
+    "Anton Bruckner",
+    "Ludwig van Beethoven",
+    "Frédéric Chopin",
+    "Carl Czerny",
+    "Claude Debussy",
+    "Antonín Dvořák",
+    "Gabriel Fauré",
+    "César Franck",
+    "Edvard Grieg",
+    "Joseph Haydn",
+    "George Frideric Handel",
+    "Franz Liszt",
+    "Wolfgang Amadeus Mozart",
+    "Felix Mendelssohn",
+    "Modest Mussorgsky",
+    "Niccolò Paganini",
+    "Sergei Rachmaninoff",
+    "Jean-Philippe Rameau",
+    "Nikolai Rimsky-Korsakov",
+    "Camille Saint-Saëns",
+    "Franz Schubert",
+    "Erik Satie",
+    "Domenico Scarlatti",
+    "Robert Schumann",
+    "Alexander Scriabin",
+    "Richard Strauss",
+    "Pyotr Ilyich Tchaikovsky",
+    "Tomaso Antonio Vitali",
+    "Antonio Vivaldi",
+}
+
+# Every header field we read, captured in one pass; values may use '...' or "..."
+HEADER_FIELD = re.compile(
+    r'\b(mutopiatitle|title|mutopiacomposer|composer|mutopiaopus|opus|piece|mutopiadate|date)'
+    r'\s*=\s*(?:"([^"]*)"|\'([^\']*)\')',
+    re.IGNORECASE,
+)
+HEADER_START = re.compile(r'\\header\b')
+YEAR = re.compile(r'\b(1[5-9]\d{2}|20\d{2})\b')
+COMPOSER_DATES = re.compile(r'\s*\([^)]*\)\s*')
+
+def read_ly_header(ly_path):
+    """
+    Streams a .ly file up to the end of its first \\header { ... } block that
+    names both a title and a composer, and returns the text read. Files with
+    no such block are read to the end, so fields set elsewhere still count.
+    """
+    lines = []
+    in_header = False
+    with open(ly_path, 'r', encoding='utf-8', errors='ignore') as f:
+        for line in f:
+            lines.append(line)
+            if not in_header:
+                match = HEADER_START.search(line)
+                if not match:
+                    continue
+                in_header, opened, depth = True, False, 0
+                line = line[match.end():]
+
+            code = line.split('%', 1)[0]  # braces in comments don't count
+            depth += code.count('{') - code.count('}')
+            opened = opened or '{' in code
+            if opened and depth <= 0:
+                # End of this header block
+                in_header = False
+                text = "".join(lines)
+                fields = {m.group(1).lower() for m in HEADER_FIELD.finditer(text)}
+                if fields & {'mutopiatitle', 'title'} and fields & {'mutopiacomposer', 'composer'}:
+                    return text
+    return "".join(lines)
+
+def parse_ly_header(ly_path):
+    """
+    Reads the header of a .ly file and extracts its metadata with a single
+    precompiled pattern. Returns a dictionary with the found metadata.
+    """
+    metadata = {}
+    try:
+        content = read_ly_header(ly_path)
+
+        # First value of each field, whichever quote style it used
+        found = {}
+        for match in HEADER_FIELD.finditer(content):
+            field = match.group(1).lower()
+            if field not in found:
+                value = match.group(2) if match.group(2) is not None else match.group(3)
+                found[field] = value.strip()
+
+        def pick_first(*fields):
+            # Mutopia fields first, then fall back to regular fields
+            for field in fields:
+                if found.get(field):
+                    return found[field]
+            return None
+
+        title = pick_first('mutopiatitle', 'title')
+        if title:
+            metadata['title'] = title
+
+        composer = pick_first('mutopiacomposer', 'composer')
+        if composer:
+            # strip dates/parentheses and excessive whitespace, e.g. "Franz Abt (1819-1885)" -> "Franz Abt"
+            composer = COMPOSER_DATES.sub('', composer).strip()
+            metadata['composer'] = {"name": composer}
+
+        opus = pick_first('mutopiaopus', 'opus')
+        if opus:
+            metadata['opus'] = opus
+
+        piece = pick_first('piece')
+        if piece:
+            metadata['piece'] = piece  # can be useful as subtitle/part name
+
+        date = pick_first('date', 'mutopiadate')
+        if date:
+            # extract 4-digit year if present
+            year = YEAR.search(date)
+            if year:
+                metadata['year'] = year.group(1)
+
+    except Exception as e:
+        print(f"    - Could not parse header from {ly_path}: {e}")
+        
+    print(f"Metadata: {metadata}")
+    return metadata
+
+def note_features(notes, onsets):
+    """
+    Returns (contour, packed contour, intervals, rhythm) for a note list and
+    its onset ticks. The packed contour (2 bits per step) and the intervals
+    (int8 semitone steps) are BSON binary.
+    """
+    contour = notes_to_contour(notes)
+    return contour, Binary(pack_contour(contour)), Binary(notes_to_intervals(notes)), onsets_to_rhythm(onsets)
+
+def midi_to_melody(midi_path, melody=DEFAULT_MELODY):
+    """
+    Parses a MIDI file and returns (melody, voices). melody holds the
+    melodic_contour, contour_packed, intervals and rhythm of the main melody,
+    taken with the named extractor in MELODY_EXTRACTORS; voices describes
+    every other track/channel with the same fields, leaving out any that
+    repeat the melody or an earlier voice.
+    Returns (None, []) on failure.
+    """
+    try:
+        try:
+            tracks = read_midi_notes(midi_path)
+        except ValueError:
+            tracks = read_midi_notes_mido(midi_path)
+
+        notes, onsets = MELODY_EXTRACTORS[melody](tracks)
+        if len(notes) < 2:
+            return None, []
+        contour, packed, intervals, rhythm = note_features(notes, onsets)
+
+        seen = {intervals}
+        voices = []
+        for track, channel, name, notes, onsets in split_voices(tracks):
+            voice_contour, voice_packed, voice_intervals, voice_rhythm = note_features(notes, onsets)
+            if voice_intervals in seen:
+                continue
+            seen.add(voice_intervals)
+            voices.append({
+                "track": track,
+                "channel": channel,
+                "name": name,
+                "note_count": len(notes),
+                "contour": voice_contour,
+                "contour_packed": voice_packed,
+                "intervals": voice_intervals,
+                "rhythm": voice_rhythm,
+            })
+        return {"melodic_contour": contour, "contour_packed": packed, "intervals": intervals, "rhythm": rhythm}, voices
+
+    except Exception as e:
+        print(f"    - Could not process MIDI {midi_path}: {e}")
+        return None, []
+
+def resolve_composer_only(composer: str | None) -> str | None:
+    """Resolve composer:
+    - Only if the provided string contains the LAST NAME of a composer in COMPOSERS
+    - Returns the full canonical name from COMPOSERS, else None
+    """
+    if not composer:
+        return None
+
+    # 1) Allowlist match → return canonical form
+    lc = composer.lower()
+    for c in COMPOSERS:
+        last = c.split()[-1].lower()
+        if last in lc:
+            return c
+    return None
+
+def process_pair(pair, melody=DEFAULT_MELODY):
+    """
+    Parses one .ly/.mid pair into a composition document, extracting the
+    melody with the named extractor.
+    Returns (dirpath, document), with document None if the pair is skipped.
+    Runs in worker processes, so it must not touch the database.
+    """
+    dirpath, ly_path, mid_path = pair
+    print(f"Processing pair in {dirpath}")
+
+    header = parse_ly_header(ly_path)
+    title = header.get('title')
+    header_composer = header.get('composer', {}).get('name')
+    year = header.get('year')
+    work_type_hint = header.get('piece')  # sometimes “Andante”, “Pavan”, etc.
+
+    # Resolve composer only (allowlist → MB artists), keep raw mutopia-first title
+    resolved_composer = resolve_composer_only(header_composer)
+    if not resolved_composer:
+        print("    -> Skipping: could not resolve composer for", dirpath)
+        return dirpath, None
+
+    final_metadata = {
+        "title": title or "Unknown Title",
+        "composer": {"name": resolved_composer}
+    }
+
+    melody_fields, voices = midi_to_melody(mid_path, melody)
+    if not melody_fields:
+        print("    -> Could not generate contour. Skipping.")
+        return dirpath, None
+
+    document = {
+        "title": final_metadata.get('title', 'Unknown Title'),
+        "composer": final_metadata.get('composer', {"name": "Unknown Composer"}),
+        **melody_fields,
+        "melody_extractor": melody,
+        "voices": voices,
+        "lilypond_path": os.path.relpath(ly_path, SOURCE_DIR).replace('\\', '/')
+    }
+    return dirpath, document
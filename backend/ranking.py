@@ -0,0 +1,69 @@
+# ranking.py
+import heapq
+from collections import namedtuple
+
+# One candidate hit: the matched window [start, end) of a document's contour,
+# its edit distance from the query and the full contour length. voice is the
+# index into the document's voices list, or None for its main melody. rhythm
+# is how well the window's rhythm agrees with the query's (0 to 1), or None
+# when the query carried no rhythm
+Match = namedtuple("Match", ["key", "start", "end", "distance", "length", "voice", "rhythm"], defaults=(None, None))
+
+# Relative weight of each component of the match score
+ALIGNMENT_WEIGHT = 0.6
+COVERAGE_WEIGHT = 0.25
+POSITION_WEIGHT = 0.15
+# Share of the score given to rhythm agreement when a match has one
+RHYTHM_WEIGHT = 0.2
+
+
+def score_match(match, query_length):
+    """
+    Scores a match between 0 and 1 from:
+    - alignment: how few edits the window needed relative to the query length
+    - coverage: how much of the piece's contour the query accounts for
+    - position: how close to the start of the piece the match occurs
+    blended with the rhythm agreement when the match has one.
+    """
+    length = max(match.length, 1)
+    alignment = 1.0 - match.distance / max(query_length, 1)
+    coverage = min(query_length / length, 1.0)
+    position = 1.0 - match.start / length
+    score = ALIGNMENT_WEIGHT * alignment + COVERAGE_WEIGHT * coverage + POSITION_WEIGHT * position
+    if match.rhythm is None:
+        return score
+    return (1.0 - RHYTHM_WEIGHT) * score + RHYTHM_WEIGHT * match.rhythm
+
+
+class RankedStream:
+    """
+    Ranks a stream of matches one per key (a composition that matches in
+    several voices is ranked by its best one) and hands out pages in score
+    order. The candidates are heapified once and each page pops only the
+    entries it needs, so the next page resumes where the last one stopped
+    without rescanning or rescoring. Ties keep the match that was found first.
+    """
+
+    def __init__(self, matches, query_length):
+        best = {}
+        examined = 0
+        for match in matches:
+            entry = (-score_match(match, query_length), examined, match)
+            examined += 1
+            if match.key not in best or entry[:2] < best[match.key][:2]:
+                best[match.key] = entry
+        self.examined = examined
+        self.heap = list(best.values())
+        heapq.heapify(self.heap)
+        self.ranked = []  # [(score, match), ...] popped so far, best first
+
+    def __len__(self):
+        """Number of ranked compositions."""
+        return len(self.ranked) + len(self.heap)
+
+    def page(self, offset, size):
+        """The [(score, match), ...] ranked offset to offset + size - 1."""
+        while len(self.ranked) < offset + size and self.heap:
+            score, _, match = heapq.heappop(self.heap)
+            self.ranked.append((-score, match))
+        return self.ranked[offset:offset + size]
@@ -0,0 +1,70 @@
+# rhythm.py
+import numpy as np
+
+# Each note from the third on gets one symbol comparing its inter-onset
+# interval (time since the previous onset) with the one before it. Symbols
+# line up with the contour; the first two notes have no ratio yet.
+SHORTER, EQUAL, LONGER = "S", "E", "L"
+NO_RATIO = "*"
+RHYTHM_SYMBOLS = {SHORTER, EQUAL, LONGER, NO_RATIO}
+
+# Ratios between these bounds count as the same duration
+RATIO_LOW = 0.8
+RATIO_HIGH = 1.25
+
+# Matches whose rhythm agrees with the query on fewer than this fraction of
+# the comparable notes are dropped before scoring
+MIN_AGREEMENT = 0.5
+
+
+def onsets_to_rhythm(onsets):
+    """
+    Converts note onset times (ticks, frames, ...) to a rhythm string the
+    length of the note list. Notes sharing an onset count as a zero interval.
+    """
+    if len(onsets) < 2:
+        return None
+    ioi = np.diff(np.asarray(onsets, dtype=np.float64))
+    current, previous = ioi[1:], ioi[:-1]
+    ratio = np.divide(current, previous, out=np.where(current > 0, np.inf, 1.0), where=previous > 0)
+    symbols = np.where(ratio < RATIO_LOW, SHORTER, np.where(ratio > RATIO_HIGH, LONGER, EQUAL))
+    return NO_RATIO * 2 + "".join(symbols.tolist())
+
+
+def rhythm_agreement(query_rhythm, rhythm, start):
+    """
+    Fraction of the query's rhythm symbols matched by the rhythm at `start`,
+    over the positions where both have a ratio. None if there are none.
+    """
+    compared = agreed = 0
+    for q, r in zip(query_rhythm, rhythm[start:start + len(query_rhythm)]):
+        if q != NO_RATIO and r != NO_RATIO:
+            compared += 1
+            agreed += q == r
+    return agreed / compared if compared else None
+
+
+class RhythmTable:
+    """
+    Rhythm strings of every voice, keyed by (key, voice), used to check the
+    rhythm of contour matches before they are scored.
+    """
+
+    def __init__(self, entries):
+        self.rhythms = {(key, voice): rhythm for key, voice, rhythm in entries}
+
+    def __len__(self):
+        return len(self.rhythms)
+
+    def filter(self, matches, query_rhythm, min_agreement=MIN_AGREEMENT):
+        """
+        Yields the matches whose rhythm agrees with the query rhythm, each
+        with its agreement set. Matches without a stored rhythm pass unchanged.
+        """
+        for match in matches:
+            rhythm = self.rhythms.get((match.key, match.voice))
+            agreement = rhythm_agreement(query_rhythm, rhythm, match.start) if rhythm else None
+            if agreement is None:
+                yield match
+            elif agreement >= min_agreement:
+                yield match._replace(rhythm=agreement)
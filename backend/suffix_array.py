@@ -0,0 +1,167 @@
+# suffix_array.py
+import os
+import numpy as np
+from corpus import SEPARATOR, MELODY_VOICE, join_contours, entry_offsets, ContourSearch
+
+INDEX_DIR = "contour_index"
+SUFFIX_ARRAY_FILE = os.path.join(INDEX_DIR, "suffix_array.npz")
+# Engine the API answers substring contour queries with, and so the one
+# on-disk index ingest.py builds: fm-index, suffix-array, or packed (scan
+# the packed contours in memory, no file)
+CONTOUR_ENGINE = os.getenv("CONTOUR_ENGINE", "fm-index")
+
+
+def build_suffix_array(text):
+    """
+    Builds the suffix array of a bytes string by prefix doubling:
+    suffixes are re-ranked on (rank[i], rank[i + k]) until every rank is unique.
+    """
+    n = len(text)
+    if n == 0:
+        return np.zeros(0, dtype=np.int32)
+
+    rank = np.frombuffer(text, dtype=np.uint8).astype(np.int64)
+    sa = np.argsort(rank, kind="stable")
+    k = 1
+    while True:
+        second = np.full(n, -1, dtype=np.int64)
+        second[:n - k] = rank[k:]
+        sa = np.lexsort((second, rank))
+
+        # New rank = index of the first suffix sharing the same (rank, second) pair
+        changed = np.empty(n, dtype=bool)
+        changed[0] = True
+        changed[1:] = (rank[sa[1:]] != rank[sa[:-1]]) | (second[sa[1:]] != second[sa[:-1]])
+        new_rank = np.empty(n, dtype=np.int64)
+        new_rank[sa] = np.cumsum(changed) - 1
+        rank = new_rank
+
+        if rank.max() == n - 1:
+            return sa.astype(np.int32)
+        k *= 2
+
+
+def build_lcp(text, sa):
+    """
+    Kasai's algorithm: lcp[i] is the length of the longest common prefix
+    of the suffixes at sa[i - 1] and sa[i] (lcp[0] is 0).
+    """
+    n = len(text)
+    rank = np.empty(n, dtype=np.int64)
+    rank[sa] = np.arange(n)
+    rank = rank.tolist()
+    order = sa.tolist()
+
+    lcp = [0] * n
+    h = 0
+    for i in range(n):
+        r = rank[i]
+        if r == 0:
+            h = 0
+            continue
+        j = order[r - 1]
+        while i + h < n and j + h < n and text[i + h] == text[j + h]:
+            h += 1
+        lcp[r] = h
+        if h:
+            h -= 1
+    return np.array(lcp, dtype=np.int32)
+
+
+class SuffixArrayIndex(ContourSearch):
+    """
+    Suffix array (plus LCP array) over every voice contour joined with
+    separators. A substring query is a binary search over the sorted suffixes,
+    and all of its occurrences sit in one contiguous range of the array, so
+    extra voices only add occurrences, not search steps.
+    """
+
+    def __init__(self, keys, voices, starts, text, sa, lcp):
+        self.keys = list(keys)
+        self.voices = [None if voice == MELODY_VOICE else voice for voice in voices]
+        self.starts = np.asarray(starts, dtype=np.int64)
+        self.text = bytes(text)
+        self.sa = sa
+        self.lcp = lcp
+        self.lengths = np.diff(np.append(self.starts, len(self.text))) - len(SEPARATOR)
+
+    @classmethod
+    def build(cls, entries):
+        """Builds the index from (key, voice, contour) entries."""
+        keys, voices, starts, text = join_contours(entries)
+        sa = build_suffix_array(text)
+        return cls(keys, voices, starts, text, sa, build_lcp(text, sa))
+
+    def save(self, path=SUFFIX_ARRAY_FILE):
+        # Written next to the path and renamed over it, so a reader never
+        # finds a half-written file
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        temp_path = path + ".tmp"
+        with open(temp_path, "wb") as f:
+            np.savez(
+                f,
+                keys=np.array(self.keys, dtype=str),
+                voices=np.array([MELODY_VOICE if voice is None else voice for voice in self.voices], dtype=np.int32),
+                starts=self.starts,
+                text=np.frombuffer(self.text, dtype=np.uint8),
+                sa=self.sa,
+                lcp=self.lcp,
+            )
+        os.replace(temp_path, path)
+
+    @classmethod
+    def load(cls, path=SUFFIX_ARRAY_FILE):
+        data = np.load(path)
+        keys = data["keys"].tolist()
+        # Indexes written before voices were stored hold main melodies only
+        voices = data["voices"].tolist() if "voices" in data.files else [MELODY_VOICE] * len(keys)
+        return cls(keys, voices, data["starts"], data["text"].tobytes(), data["sa"], data["lcp"])
+
+    def __len__(self):
+        return len(self.keys)
+
+    def _lower_bound(self, pattern):
+        """First suffix-array row whose suffix is >= pattern."""
+        text, sa, m = self.text, self.sa, len(pattern)
+        lo, hi = 0, len(sa)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            start = sa[mid]
+            if text[start:start + m] < pattern:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _range(self, query):
+        """Returns the [lo, hi) rows of the suffixes that start with the query."""
+        pattern = query.upper().encode("ascii", errors="replace")
+        m = len(pattern)
+        if m == 0 or SEPARATOR in pattern:
+            return 0, 0
+
+        lo = self._lower_bound(pattern)
+        start = self.sa[lo] if lo < len(self.sa) else 0
+        if lo == len(self.sa) or self.text[start:start + m] != pattern:
+            return lo, lo
+
+        # Occurrences continue while neighbouring suffixes share >= m characters
+        hi, step = lo + 1, 64
+        while hi < len(self.lcp):
+            block = self.lcp[hi:hi + step]
+            short = np.flatnonzero(block < m)
+            if short.size:
+                return lo, hi + int(short[0])
+            hi += block.size
+            step *= 2
+        return lo, hi
+
+    def count(self, query):
+        """Number of occurrences of the query across all contours."""
+        lo, hi = self._range(query)
+        return hi - lo
+
+    def locate(self, query):
+        """Sorted (entry id, offset) pairs for every occurrence of the query."""
+        lo, hi = self._range(query)
+        return entry_offsets(self.starts, np.sort(self.sa[lo:hi]))